@@ -0,0 +1,79 @@
+"""
+Benchmark loading and dumping ``jsonb`` values with the JSONField of process.models, against Django's JSONField.
+
+Loading is what reading releases and records costs, for example while compiling and checking. Dumping is what writing
+check results and notes costs. The releases are repeated from the ``tests/fixtures/collection_file.json`` fixture, with
+numbers decoded as Decimal values, like the file worker. No database is needed.
+
+Run from the root directory of the repository:
+
+    python benchmarks/jsonfield.py --count 10000 --repeat 3
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import django
+import simplejson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+django.setup()
+
+from django.db import connection, models  # noqa: E402
+
+from process.models import JSONField  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+
+
+def load(field, texts):
+    for text in texts:
+        field.from_db_value(text, None, connection)
+
+
+def dump(field, values):
+    for value in values:
+        wrapper = field.get_db_prep_value(value, connection)
+        wrapper.dumps(wrapper.obj)
+
+
+def best(function, *args, repeat):
+    """Return the least time, in seconds, that the function took, of ``repeat`` runs."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=10_000, help="the number of releases (default 10000)")
+    parser.add_argument("--repeat", type=int, default=3, help="the number of runs, of which the best is kept")
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURE, "collection_file.json")) as f:
+        releases = simplejson.load(f, use_decimal=True)[0]["releases"]
+    releases = (releases * math.ceil(args.count / len(releases)))[: args.count]
+    # Like the text that PostgreSQL returns for a jsonb value.
+    texts = [simplejson.dumps(release) for release in releases]
+
+    fields = {
+        "before": models.JSONField(encoder=simplejson.JSONEncoder),
+        "after": JSONField(encoder=simplejson.JSONEncoder),
+    }
+
+    print(f"{args.count:,} releases ({sum(map(len, texts)) / 1e6:.1f} MB), best of {args.repeat}")
+    for operation, values in ((load, texts), (dump, releases)):
+        for label, field in fields.items():
+            seconds = best(operation, field, values, repeat=args.repeat)
+            print(f"{operation.__name__} {label}: {seconds / args.count * 1e6:.1f}us/row")
+
+
+if __name__ == "__main__":
+    main()
@@ -91,8 +91,15 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# https://docs.djangoproject.com/en/5.2/ref/databases/#persistent-connections
 DATABASES = {
-    "default": dj_database_url.config(default="postgresql:///kingfisher_process?application_name=kingfisher_process"),
+    "default": dj_database_url.config(
+        default="postgresql:///kingfisher_process?application_name=kingfisher_process",
+        # The number of seconds for which to reuse a database connection, across requests and messages.
+        conn_max_age=int(os.getenv("DATABASE_CONN_MAX_AGE", "0")),
+        # Check that a reused connection is usable, before its first query in a request or message.
+        conn_health_checks=True,
+    ),
 }
 # https://docs.djangoproject.com/en/5.2/ref/databases/#server-side-parameters-binding
 DATABASES["default"].setdefault("OPTIONS", {})["server_side_binding"] = True
@@ -241,6 +248,9 @@ REST_FRAMEWORK = {
 RABBIT_URL = os.getenv("RABBIT_URL", "amqp://127.0.0.1")
 # The name of the RabbitMQ exchange. Follow the pattern `{project}_{service}_{environment}`.
 RABBIT_EXCHANGE_NAME = os.getenv("RABBIT_EXCHANGE_NAME", "kingfisher_process_development")
+# The maximum priority of messages, or 0 to not declare priority queues.
+# https://www.rabbitmq.com/docs/priority
+RABBIT_MAX_PRIORITY = int(os.getenv("RABBIT_MAX_PRIORITY", "0"))
 
 # If these are not configured, then source_id is not validated.
 SCRAPYD = {
@@ -259,12 +269,38 @@ KINGFISHER_COLLECT_FILES_STORE = os.getenv(
 # Whether to deduplicate rows in the `package_data` and `data` tables.
 DEDUPLICATE_DATA = os.getenv("DEDUPLICATE_DATA", "True") == "True"
 
-# The number of rows to insert per statement, when DEDUPLICATE_DATA is disabled.
+# Whether to load rows with COPY instead of INSERT, when DEDUPLICATE_DATA is disabled.
+COPY_DATA = os.getenv("COPY_DATA", "False") == "True"
+
+# The number of ids of PackageData and Data rows, by hash, that each worker caches, when DEDUPLICATE_DATA is enabled.
+# 0 to disable.
+DATA_CACHE_SIZE = int(os.getenv("DATA_CACHE_SIZE", "0"))
+
+# Whether to copy the rows of an identical file in a completed collection, instead of loading the file again, when
+# DEDUPLICATE_DATA is enabled.
+REUSE_FILES = os.getenv("REUSE_FILES", "False") == "True"
+
+# The number of rows to insert per statement.
 BULK_CREATE_BATCH_SIZE = int(os.getenv("BULK_CREATE_BATCH_SIZE", "1000"))
 
+# The number of bytes of a file's items above which to insert the items read so far. 0 to disable. (8 MiB)
+BULK_CREATE_BATCH_BYTES = int(os.getenv("BULK_CREATE_BATCH_BYTES", "8388608"))
+
+# The number of bytes above which to split a file into chunks, to load in parallel. 0 to disable.
+FILE_CHUNK_SIZE = int(os.getenv("FILE_CHUNK_SIZE", "0"))
+
+# The number of processes with which to upgrade data in the file_worker worker. 0 to upgrade in its threads.
+FILE_WORKER_PROCESSES = int(os.getenv("FILE_WORKER_PROCESSES", "0"))
+
+# The number of batches that the file_worker worker reads ahead while writing. 0 to read and write in turn.
+FILE_WORKER_QUEUE_SIZE = int(os.getenv("FILE_WORKER_QUEUE_SIZE", "2"))
+
 # The number of OCIDs to compile at once.
 COMPILE_BATCH_SIZE = int(os.getenv("COMPILE_BATCH_SIZE", "100"))
 
+# The number of releases to compile at once. An OCID with more releases is compiled alone.
+COMPILE_BATCH_RELEASES = int(os.getenv("COMPILE_BATCH_RELEASES", "1000"))
+
 # The version of OCDS with which to initialize the ProfileBuilder.
 COMPILER_OCDS_VERSION = "1__1__5"
 
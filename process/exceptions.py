@@ -26,3 +26,7 @@ class EmptyFormatError(KingfisherProcessError):
 
 class UnsupportedFormatError(KingfisherProcessError):
     """Raised if a collection file's format is unsupported."""
+
+
+class DecompressionError(KingfisherProcessError):
+    """Raised if a compressed file or archive member is corrupt."""
@@ -23,13 +23,28 @@ class KingfisherForm(forms.ModelForm):
 class CollectionForm(KingfisherForm):
     class Meta:
         model = Collection
-        fields = ["source_id", "data_version", "sample", "transform_type", "parent", "steps", "scrapyd_job"]
+        fields = [
+            "source_id",
+            "data_version",
+            "sample",
+            "transform_type",
+            "parent",
+            "steps",
+            "scrapyd_job",
+            "incremental_from",
+            "priority",
+        ]
 
     force = forms.BooleanField(required=False)
+    # Whether releases are compiled (in this or a derived collection).
+    compile = forms.BooleanField(required=False)
 
     def clean(self):
         cleaned_data = super().clean()
 
+        if incremental_from := cleaned_data.get("incremental_from"):
+            self.clean_incremental_from_collection(incremental_from)
+
         if process.scrapyd.configured():
             scrapyd_spiders = cache.get_or_set("scrapyd_spiders", process.scrapyd.spiders)
             for spider in list(scrapyd_spiders):
@@ -49,6 +64,11 @@ class CollectionForm(KingfisherForm):
                     message = _("%(value)r is not a spider in the %(project)s project of Scrapyd (can be forced)")
                 self.add_error("source_id", ValidationError(message, params=params, code="invalid_choice"))
 
+    def clean_incremental_from_collection(self, incremental_from):
+        if not settings.DEDUPLICATE_DATA:
+            message = _("Base collection %(id)s requires DEDUPLICATE_DATA to be enabled")
+            self.add_error("incremental_from", ValidationError(message, params={"id": incremental_from.pk}))
+
     def error_message_formatter(self, field, error):
         if field == "data_version" and error.code == "invalid":
             return _('%(field)s %(value)r is not in "YYYY-MM-DD HH:MM:SS" format or is an invalid date/time') % {
@@ -48,4 +48,4 @@ class Command(CollectionCommand):
                 for collection_file_id in qs.iterator():
                     create_step(ProcessingStep.Name.CHECK, collection.pk, collection_file_id=collection_file_id)
                     message = {"collection_id": collection.pk, "collection_file_id": collection_file_id}
-                    client.publish(message, routing_key=routing_key)
+                    client.publish(message, routing_key=routing_key, priority=collection.priority)
@@ -1,11 +1,10 @@
 from django.core.management.base import CommandError
-from django.db import transaction
 from django.utils.translation import gettext as t
 from django.utils.translation import gettext_lazy as _
 
 from process.cli import CollectionCommand
-from process.processors.loader import create_collection_file, file_or_directory
-from process.util import get_publisher, walk
+from process.processors.loader import bulk_create_collection_files, file_or_directory
+from process.util import get_publisher, split_file, walk
 from process.util import wrap as w
 
 routing_key = "loader"
@@ -35,16 +34,21 @@ class Command(CollectionCommand):
         except StopIteration:
             raise CommandError(_("No files to load")) from None
 
-        with get_publisher() as client:
-            for path in walk(options["path"]):
-                self.stderr.write(f"Adding {path}")
-
-                # The transaction is inside the loop, since we can't rollback RabbitMQ messages, only PostgreSQL
-                # statements. This ensures that any published message is paired with a database commit.
-                with transaction.atomic():
-                    collection_file = create_collection_file(collection, filename=path)
+        filenames = (filename for path in walk(options["path"]) for filename in split_file(path))
 
-                message = {"collection_id": collection.pk, "collection_file_id": collection_file.pk}
-                client.publish(message, routing_key=routing_key)
+        with get_publisher() as client:
+            # Each batch is committed before it is yielded, since we can't rollback RabbitMQ messages, only PostgreSQL
+            # statements. This ensures that any published message is paired with a database commit.
+            for collection_files in bulk_create_collection_files(collection, filenames):
+                for collection_file in collection_files:
+                    self.stderr.write(f"Adding {collection_file.filename}")
+
+                client.publish_many(
+                    (
+                        ({"collection_id": collection.pk, "collection_file_id": collection_file.pk}, routing_key)
+                        for collection_file in collection_files
+                    ),
+                    priority=collection.priority,
+                )
 
         self.stderr.write(self.style.SUCCESS("Done"))
@@ -4,11 +4,11 @@ from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils.translation import gettext as t
-from yapw.methods import ack, publish
+from yapw.methods import ack
 
 from process.models import Collection
 from process.processors.loader import create_collection_file
-from process.util import consume, decorator
+from process.util import consume, decorator, expand_archive, publish, split_file
 from process.util import wrap as w
 
 # Other applications use this routing key.
@@ -39,11 +39,16 @@ def callback(client_state, channel, method, properties, input_message):
         ack(client_state, channel, method.delivery_tag)
         return
 
+    # Each member of an archive, or chunk of a large file, is its own collection file.
     with transaction.atomic():
-        filename = os.path.join(settings.KINGFISHER_COLLECT_FILES_STORE, path)
-        collection_file = create_collection_file(collection, filename=filename, url=url)
-
-    message = {"collection_id": collection_id, "collection_file_id": collection_file.pk}
-    publish(client_state, channel, message, routing_key)
+        collection_files = [
+            create_collection_file(collection, filename=filename, url=url)
+            for member in expand_archive(os.path.join(settings.KINGFISHER_COLLECT_FILES_STORE, path))
+            for filename in split_file(member)
+        ]
+
+    for collection_file in collection_files:
+        message = {"collection_id": collection_id, "collection_file_id": collection_file.pk}
+        publish(client_state, channel, message, routing_key, priority=collection.priority)
 
     ack(client_state, channel, method.delivery_tag)
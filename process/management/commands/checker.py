@@ -10,10 +10,10 @@ from libcoveocds.config import LibCoveOCDSConfig
 from libcoveocds.lib.api import context_api_transform
 from libcoveocds.schema import SchemaOCDS
 from ocdskit.util import Format
-from yapw.methods import ack, publish
+from yapw.methods import ack
 
 from process.models import CollectionFile, ProcessingStep, Record, RecordCheck, Release, ReleaseCheck
-from process.util import consume, decorator, deleting_step, get_extensions
+from process.util import consume, decorator, deleting_step, get_extensions, publish
 from process.util import wrap as w
 
 consume_routing_keys = ["file_worker", "addchecks"]
@@ -62,7 +62,7 @@ def callback(client_state, channel, method, properties, input_message):
             _check_collection_file(collection_file)
 
     message = {"collection_id": collection_id, "collection_file_id": collection_file_id}
-    publish(client_state, channel, message, routing_key)
+    publish(client_state, channel, message, routing_key, priority=collection_file.collection.priority)
 
     ack(client_state, channel, method.delivery_tag)
 
@@ -33,11 +33,10 @@ class Command(CollectionCommand):
                     upgraded_collection.store_end_at = Now()
                     upgraded_collection.save(update_fields=["store_end_at"])
 
+        collections = [collection, upgraded_collection, collection.get_compiled_collection()]
         with get_publisher() as client:
-            client.publish({"collection_id": collection.pk}, routing_key=routing_key)
-            if upgraded_collection:
-                client.publish({"collection_id": upgraded_collection.pk}, routing_key=routing_key)
-            if compiled_collection := collection.get_compiled_collection():
-                client.publish({"collection_id": compiled_collection.pk}, routing_key=routing_key)
+            client.publish_many(
+                (({"collection_id": c.pk}, routing_key) for c in collections if c), priority=collection.priority
+            )
 
         self.stderr.write(self.style.SUCCESS("done"))
@@ -1,14 +1,15 @@
 import functools
 import logging
+from itertools import islice
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils.translation import gettext as t
 from ocdskit.util import Format
-from yapw.methods import ack, publish
+from yapw.methods import ack
 
 from process.models import Collection, CollectionFile, ProcessingStep, Record
-from process.util import consume, create_step, decorator
+from process.util import consume, create_step, decorator, publish
 from process.util import wrap as w
 
 consume_routing_keys = ["file_worker", "collection_closed"]
@@ -86,22 +87,27 @@ def callback(client_state, channel, method, properties, input_message):
             _publish, client_state, channel, collection, compiled_collection, publish_routing_key
         )
 
-        batch = []
-        for item in items.values("ocid").distinct().iterator():
-            ocid = item["ocid"]
-            create_step(ProcessingStep.Name.COMPILE, compiled_collection.pk, ocid=ocid)
-
-            if data_format == Format.release_package:
-                # Batch OCIDs for a "release package" collection.
-                batch.append(ocid)
-                if len(batch) >= settings.COMPILE_BATCH_SIZE:
-                    publish_compile(ocids=batch)
-                    batch = []
-            else:
-                publish_compile(ocid=ocid)
-
-        if batch:
-            publish_compile(ocids=batch)
+        if data_format == Format.release_package:
+            # Publish ranges of OCIDs for a "release package" collection, instead of enumerating every OCID. A range
+            # includes OCIDs after its lower bound (exclusive) up to its upper bound (inclusive). A single step tracks
+            # the range, by its upper bound, which is distinct from other ranges' upper bounds.
+            releases = items.order_by("ocid").values_list("ocid", flat=True)
+            last = releases.last()
+            after = None
+            while after != last:
+                upto = _get_upper_bound(releases if after is None else releases.filter(ocid__gt=after), last)
+                create_step(ProcessingStep.Name.COMPILE, compiled_collection.pk, ocid=upto)
+                publish_compile(ocid_range=[after, upto])
+                after = upto
+        else:
+            ocids = (item["ocid"] for item in items.values("ocid").distinct().iterator())
+            while batch := list(islice(ocids, settings.COMPILE_BATCH_SIZE)):
+                ProcessingStep.objects.bulk_create(
+                    ProcessingStep(name=ProcessingStep.Name.COMPILE, collection_id=compiled_collection.pk, ocid=ocid)
+                    for ocid in batch
+                )
+                for ocid in batch:
+                    publish_compile(ocid=ocid)
 
         # This ensures the finisher only completes a "release package" collection after creating all processing steps.
         if data_format == Format.release_package:
@@ -120,9 +126,37 @@ def callback(client_state, channel, method, properties, input_message):
             collection_file.save(update_fields=["compilation_started"])
 
 
+def _get_upper_bound(releases, last):
+    """
+    Return the upper bound of the next range of OCIDs to compile.
+
+    The range has at most COMPILE_BATCH_SIZE OCIDs and COMPILE_BATCH_RELEASES releases, so that messages take similar
+    time. If the first OCID alone has more releases, the range has only that OCID.
+
+    The index on (collection, ocid, release_date) serves these queries.
+
+    :param releases: the OCIDs of the remaining releases, ordered by OCID
+    :param last: the last OCID
+    """
+    bounds = [last]
+
+    ocid = releases.distinct()[settings.COMPILE_BATCH_SIZE - 1 : settings.COMPILE_BATCH_SIZE].first()
+    if ocid is not None:
+        bounds.append(ocid)
+
+    # The OCID of the first release over budget starts the next range, unless it is the first OCID.
+    ocid = releases[settings.COMPILE_BATCH_RELEASES : settings.COMPILE_BATCH_RELEASES + 1].first()
+    if ocid is not None:
+        previous = releases.filter(ocid__lt=ocid).last()
+        bounds.append(ocid if previous is None else previous)
+
+    # Choose the minimum in the database's collation, which orders the ranges, instead of in Python's code point order.
+    return releases.filter(ocid__in=bounds).first()
+
+
 def _publish(client_state, channel, collection, compiled_collection, routing_key, **payload):
     message = {"collection_id": collection.pk, "compiled_collection_id": compiled_collection.pk, **payload}
-    publish(client_state, channel, message, routing_key)
+    publish(client_state, channel, message, routing_key, priority=collection.priority)
 
 
 def compilable(collection):
@@ -1,23 +1,34 @@
+import copy
+import functools
+import itertools
 import logging
+import math
+import multiprocessing
 import random
 import time
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
 from itertools import islice
 
+import django
 import ijson
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import OperationalError, transaction
+from django.db import IntegrityError, OperationalError, connection, transaction
 from django.utils.translation import gettext as t
 from ijson import ObjectBuilder
+from ijson.utils import sendable_list
 from ocdskit.exceptions import UnknownFormatError
 from ocdskit.upgrade import upgrade_10_11
 from ocdskit.util import Format, detect_format
-from psycopg.errors import ProgramLimitExceeded
-from yapw.methods import ack, nack, publish
+from psycopg import sql
+from psycopg.errors import ForeignKeyViolation, ProgramLimitExceeded
+from yapw.methods import ack, nack
 
 from process.exceptions import EmptyFormatError, UnsupportedFormatError
 from process.models import (
+    Collection,
     CollectionFile,
     CollectionNote,
     CompiledRelease,
@@ -28,14 +39,27 @@ from process.models import (
     Release,
 )
 from process.util import (
+    DECOMPRESSION_ERRORS,
+    Prefetcher,
+    add_counts,
+    bulk_copy,
+    bulk_get_or_create_ids,
+    canonical_json,
+    capture_warnings,
     consume,
-    create_logger_note,
+    copy_rows,
     create_note,
     create_step,
     decorator,
     delete_step,
     deleting_step,
+    get_file_hash,
+    get_hash_id_cache,
     get_or_create,
+    open_file,
+    publish,
+    serialize_json,
+    split_chunk,
 )
 from process.util import wrap as w
 
@@ -46,6 +70,9 @@ logger = logging.getLogger(__name__)
 SUPPORTED_FORMATS = {Format.release_package, Format.record_package, Format.compiled_release}
 ERROR = CollectionNote.Level.ERROR
 MAX_ATTEMPTS = 5
+# The number of bytes to read from a file at a time.
+BUFFER_SIZE = 1024 * 1024
+NULL_ESCAPE = b"\\u0000"
 
 
 class Command(BaseCommand):
@@ -68,7 +95,9 @@ def finish(collection_id, collection_file_id, exception):
     # in case it was not created the first time. deleting_step() will delete any duplicate steps.
     #
     # See the try/except block in the callback() function of the file_worker worker.
-    if settings.ENABLE_CHECKER and not isinstance(exception, FileNotFoundError | ijson.common.IncompleteJSONError):
+    if settings.ENABLE_CHECKER and not isinstance(
+        exception, (FileNotFoundError, ijson.common.IncompleteJSONError, *DECOMPRESSION_ERRORS)
+    ):
         create_step(ProcessingStep.Name.CHECK, collection_id, collection_file_id=collection_file_id)
 
 
@@ -119,20 +148,19 @@ def callback(client_state, channel, method, properties, input_message):
 
         for attempt in range(1, MAX_ATTEMPTS + 1):
             try:
-                with (
-                    deleting_step(
-                        ProcessingStep.Name.LOAD,
-                        collection_file_id=collection_file_id,
-                        finish=finish,
-                        finish_args=(collection_id, collection_file_id),
-                    ),
-                    transaction.atomic(),
+                # process_file() commits each batch, so that a retry resumes after the last committed batch.
+                with deleting_step(
+                    ProcessingStep.Name.LOAD,
+                    collection_file_id=collection_file_id,
+                    finish=finish,
+                    finish_args=(collection_id, collection_file_id),
                 ):
                     upgraded_collection_file_id = process_file(collection_file)
             except OperationalError as e:
                 # Data that exceeds a PostgreSQL size limit can never be stored, so skip the file.
                 if isinstance(e.__cause__, ProgramLimitExceeded):
                     logger.exception("%s is too large to store, skipping", collection_file.filename)
+                    _discard_loaded_items(collection_file)
                     delete_step(ProcessingStep.Name.LOAD, collection_file_id=collection_file_id)
                     create_note(
                         collection,
@@ -150,11 +178,20 @@ def callback(client_state, channel, method, properties, input_message):
 
                 # Make the threads retry at different times, to avoid repeating the deadlock.
                 time.sleep(random.randint(1, 5))  # noqa: S311 # non-cryptographic
+            except IntegrityError as e:
+                # If the deleteorphan command deleted a row whose id is cached. See get_hash_id_cache().
+                if not isinstance(e.__cause__, ForeignKeyViolation) or attempt == MAX_ATTEMPTS:
+                    raise
+
+                logger.warning(
+                    "Stale cache on %s %s (%d/%d)\n%s", collection, collection_file, attempt, MAX_ATTEMPTS, e
+                )
+                get_hash_id_cache.cache_clear()
             else:
                 break
 
         message = {"collection_id": collection_id, "collection_file_id": collection_file_id}
-        publish(client_state, channel, message, routing_key)
+        publish(client_state, channel, message, routing_key, priority=collection.priority)
 
         if upgraded_collection_file_id:
             # The deleting_step() context manager sets upgraded_collection_file_id only if successful, so we can create
@@ -163,20 +200,51 @@ def callback(client_state, channel, method, properties, input_message):
                 create_step(ProcessingStep.Name.CHECK, collection_id, collection_file_id=upgraded_collection_file_id)
 
             message = {"collection_id": collection_id, "collection_file_id": upgraded_collection_file_id}
-            publish(client_state, channel, message, routing_key)
+            publish(client_state, channel, message, routing_key, priority=collection.priority)
     # Irrecoverable errors. Discard the message to allow other messages to be processed.
-    except FileNotFoundError:  # raised by detect_format() or open()
+    except FileNotFoundError:  # raised by detect_format() or open_file()
         logger.exception("%s has disappeared, skipping", collection_file.filename)
+        _discard_loaded_items(collection_file)
         create_note(collection, ERROR, f"{collection_file.filename} has disappeared", data=input_message)
         nack(client_state, channel, method.delivery_tag, requeue=False)
     except ijson.common.IncompleteJSONError:  # raised by ijson.parse()
         logger.exception("Source %s yields invalid JSON, skipping", collection.source_id)
+        _discard_loaded_items(collection_file)
         create_note(collection, ERROR, f"Source {collection.source_id} yields invalid JSON", data=input_message)
         nack(client_state, channel, method.delivery_tag, requeue=False)
+    except DECOMPRESSION_ERRORS:  # raised while reading a compressed file or archive
+        logger.exception("%s is corrupt, skipping", collection_file.filename)
+        _discard_loaded_items(collection_file)
+        create_note(collection, ERROR, f"{collection_file.filename} is corrupt", data=input_message)
+        nack(client_state, channel, method.delivery_tag, requeue=False)
     else:
         ack(client_state, channel, method.delivery_tag)
 
 
+def _discard_loaded_items(collection_file):
+    """
+    Delete the items of a partially loaded file that is skipped, so that a file is either loaded or skipped.
+
+    Any orphaned data is left for the deleteorphan command.
+    """
+    counts = []
+    with transaction.atomic():
+        if upgraded_collection := collection_file.collection.get_upgraded_collection():
+            _, deleted = CollectionFile.objects.filter(
+                collection=upgraded_collection, filename=collection_file.filename
+            ).delete()
+            counts.extend(
+                (upgraded_collection.pk, model, -deleted.get(model._meta.label, 0))
+                for model in (Release, Record, CompiledRelease)
+            )
+        for model in (Release, Record, CompiledRelease):
+            _, deleted = model.objects.filter(collection_file=collection_file).delete()
+            counts.append((collection_file.collection_id, model, -deleted.get(model._meta.label, 0)))
+        CollectionFile.objects.filter(pk=collection_file.pk).update(loaded_items_count=0)
+        add_counts(counts)
+    collection_file.loaded_items_count = 0
+
+
 def process_file(collection_file) -> int | None:
     """
     Load file for a given collection.
@@ -184,30 +252,129 @@ def process_file(collection_file) -> int | None:
     Create the collection_file and either the release, record or compiled_release.
     If the collection should be upgraded, create the same structure for upgraded collection as well.
 
+    The file is parsed once. Each item is stored in the original collection and, if any, the upgraded collection.
+
+    Each batch is committed with a checkpoint of the number of items loaded, so that a retry or a redelivered message
+    resumes loading after the last committed batch. The collection file's row is locked while a batch is stored, and
+    the items that another delivery of the same message stored meanwhile are skipped.
+
     :param collection_file: collection file for which should be releases checked
     :returns: upgraded collection file id or None (if there is no upgrade planned)
     """
     data_type = collection_file.collection.data_type
 
-    if data_type["format"] == Format.compiled_release:
-        package = None
-    else:
-        package = _read_package_data_from_file(collection_file.filename, data_type)
-
-    logger.debug("Writing data for collection_file %s", collection_file.pk)
-    releases_or_records = _read_data_from_file(collection_file.filename, data_type)
-    _store_data(collection_file, package, releases_or_records, data_type, upgrade=False)
-
+    upgraded_collection_file = None
     if upgraded_collection := collection_file.collection.get_upgraded_collection():
-        upgraded_collection_file = CollectionFile(
-            collection=upgraded_collection, filename=collection_file.filename, url=collection_file.url
+        upgraded_collection_file, _ = CollectionFile.objects.get_or_create(
+            collection=upgraded_collection, filename=collection_file.filename, defaults={"url": collection_file.url}
         )
-        upgraded_collection_file.save()
 
-        logger.debug("Writing data for upgraded collection_file %s", upgraded_collection_file.pk)
-        releases_or_records = _read_data_from_file(collection_file.filename, data_type)
-        _store_data(upgraded_collection_file, package, releases_or_records, data_type, upgrade=True)
+    collection_file.refresh_from_db(fields=["loaded_items_count"])
+    loaded_items_count = collection_file.loaded_items_count
+
+    # Sharing rows between collections requires deduplication, since the wiper deletes the data of non-deduplicated
+    # rows.
+    hash_md5 = ""
+    if settings.REUSE_FILES and settings.DEDUPLICATE_DATA:
+        hash_md5 = get_file_hash(collection_file.filename)
+        if not loaded_items_count and _reuse_loaded_file(
+            collection_file, upgraded_collection_file, data_type, hash_md5
+        ):
+            return upgraded_collection_file and upgraded_collection_file.pk
+
+    package_data = None
+    # The package metadata that package_data stores.
+    stored_package = None
+    if loaded_items_count:
+        logger.info("Resuming collection_file %s after %d items", collection_file.pk, loaded_items_count)
+        # Reference the same package data as the items that are already loaded.
+        if package_data := _get_loaded_package_data(collection_file, data_type):
+            stored_package = package_data.data
 
+    logger.debug("Writing data for collection_file %s", collection_file.pk)
+    model, _ = _get_model_and_columns(data_type)
+    reader = FileReader(collection_file.filename, data_type)
+    # The file is read and serialized in a separate thread, while this thread writes to the database.
+    pipeline = Prefetcher(
+        _serialize_batches(_read_batches(reader, loaded_items_count), upgrade=upgraded_collection_file is not None),
+        settings.FILE_WORKER_QUEUE_SIZE,
+    )
+
+    start = time.perf_counter()
+    # Close the iterator if writing fails, to stop the reading thread.
+    with closing(iter(pipeline)) as batches:
+        for release_or_record_batch, package, serialized, upgraded_serialized, warnings in batches:
+            end = loaded_items_count + len(release_or_record_batch)
+            with transaction.atomic():
+                if package_data is None and package is not None:
+                    stored_package = package
+                    package_data = get_or_create(PackageData, stored_package, floats=False)
+
+                # Another delivery of the same message might have stored items since the checkpoint was read.
+                checkpoint = (
+                    CollectionFile.objects.select_for_update()
+                    .values_list("loaded_items_count", flat=True)
+                    .get(pk=collection_file.pk)
+                )
+                if checkpoint < end:
+                    skip = max(checkpoint - loaded_items_count, 0)
+                    if skip:
+                        logger.info(
+                            "Skipping %d items of collection_file %s stored by another delivery",
+                            skip,
+                            collection_file.pk,
+                        )
+                        release_or_record_batch = release_or_record_batch[skip:]
+                        serialized = serialized[skip:]
+
+                    stored = _store_data(collection_file, package_data, release_or_record_batch, data_type, serialized)
+                    counts = [(collection_file.collection_id, model, stored)]
+                    if upgraded_collection_file:
+                        if warnings:
+                            create_note(upgraded_collection, CollectionNote.Level.WARNING, warnings)
+                        # upgrade_10_11() doesn't change the ocid, id or date of releases and records.
+                        stored = _store_data(
+                            upgraded_collection_file,
+                            package_data,
+                            release_or_record_batch,
+                            data_type,
+                            upgraded_serialized[skip:],
+                        )
+                        counts.append((upgraded_collection_file.collection_id, model, stored))
+
+                    CollectionFile.objects.filter(pk=collection_file.pk).update(loaded_items_count=end)
+                    add_counts(counts)
+
+            # Update the count only once committed, in case the transaction is rolled back.
+            loaded_items_count = end
+            collection_file.loaded_items_count = loaded_items_count
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "Loaded collection_file %s in %.3fs: read %.3fs (%.3fs waiting for writes), write %.3fs (%.3fs waiting "
+        "for reads)",
+        collection_file.pk,
+        elapsed,
+        pipeline.produce_time,
+        pipeline.produce_wait,
+        elapsed - pipeline.consume_wait,
+        pipeline.consume_wait,
+    )
+
+    with transaction.atomic():
+        # If package metadata follows the releases or records, update the references to the complete metadata.
+        if package_data is not None and reader.package != stored_package:
+            _update_package_data(
+                [collection_file, upgraded_collection_file],
+                package_data,
+                get_or_create(PackageData, reader.package, floats=False),
+            )
+
+        # Set the hash once loaded, so that only completely loaded files are reused.
+        if hash_md5:
+            CollectionFile.objects.filter(pk=collection_file.pk).update(hash_md5=hash_md5)
+
+    if upgraded_collection_file:
         return upgraded_collection_file.pk
 
     return None
@@ -215,8 +382,12 @@ def process_file(collection_file) -> int | None:
 
 def set_data_type(collection, collection_file):
     if not collection.data_type:
+        # Detect the format of the whole file, not of a chunk, since a chunk of concatenated JSON can have one value.
+        path, _ = split_chunk(collection_file.filename)
         detected_format, is_concatenated, is_array = detect_format(
-            collection_file.filename, additional_prefixes=("extensions",)
+            path,
+            reader=lambda filename, _mode: open_file(filename),
+            additional_prefixes=("extensions",),
         )
 
         # https://github.com/open-contracting/kingfisher-collect/issues/1012
@@ -245,11 +416,29 @@ def set_data_type(collection, collection_file):
 class ControlCodesFilter:
     def __init__(self, file):
         self.file = file
+        self.tail = b""
+        self.bytes_read = 0
 
     def read(self, buf_size):
-        # Replace the "\u0000" escape sequence in the JSON string, which is rejected by PostgreSQL.
-        # https://www.postgresql.org/docs/current/datatype-json.html
-        return self.file.read(buf_size).replace(b"\\u0000", b"")
+        while chunk := self.file.read(buf_size):
+            data = self.tail + chunk
+            self.tail = b""
+
+            # Hold back a partial escape sequence at the end of the chunk, in case the next chunk completes it.
+            if (index := data.rfind(b"\\", -5)) != -1 and NULL_ESCAPE.startswith(data[index:]):
+                data, self.tail = data[:index], data[index:]
+
+            # Replace the "\u0000" escape sequence in the JSON string, which is rejected by PostgreSQL.
+            # https://www.postgresql.org/docs/current/datatype-json.html
+            #
+            # An empty return value means the end of the file, so read more if all the data is replaced or held back.
+            if data := data.replace(NULL_ESCAPE, b""):
+                self.bytes_read += len(data)
+                return data
+
+        data, self.tail = self.tail, b""
+        self.bytes_read += len(data)
+        return data
 
 
 def _get_data_key(data_type):
@@ -267,44 +456,89 @@ def _get_data_key(data_type):
     return ".".join(data_key)
 
 
-def _read_package_data_from_file(filename, data_type):
-    package = {}
-
-    # If the file is an array of packages, only the first package metadata is extracted.
-    package_key = "item" if data_type["array"] else ""
-    data_key = _get_data_key(data_type).removesuffix(".item")
-
-    with open(filename, "rb") as f:
-        build = False
-        builder = ObjectBuilder()
-
-        # Constructs Decimal values. https://github.com/ICRAR/ijson#options
-        for prefix, event, value in ijson.parse(ControlCodesFilter(f), multiple_values=True):
-            if prefix == package_key:
-                # Start of package.
-                if event == "start_map":
-                    build = True
-                    builder = ObjectBuilder()
-                # End of package.
-                elif event == "end_map":
-                    build = False
-                    return builder.value
+class FileReader:
+    """
+    Read the package metadata and the items (releases, records or compiled releases) of a file in a single pass.
 
-            if build and not prefix.startswith(data_key):
-                builder.event(event, value)
+    Iterating over the instance yields each item. While iterating, the ``package`` attribute is the package metadata
+    read so far. Once iteration is complete, it is the complete package metadata. It is ``None`` for compiled releases.
 
-    return package
+    If the file is an array of packages, only the first package metadata is read.
 
+    With the yajl2_c backend, compiled releases and single packages are built in C. A single package's items are
+    yielded as each chunk is parsed. Arrays of packages and concatenated packages are read event by event, in Python.
+    """
 
-def _read_data_from_file(filename, data_type):
-    data_key = _get_data_key(data_type)
+    def __init__(self, filename, data_type):
+        self.filename = filename
+        self.data_type = data_type
+        self.package = None if data_type["format"] == Format.compiled_release else {}
+        self._reader = None
+
+    @property
+    def bytes_read(self):
+        """The number of bytes read so far, which the parser reads ahead in chunks of ``BUFFER_SIZE``."""
+        return self._reader.bytes_read if self._reader else 0
+
+    def __iter__(self):
+        with open_file(self.filename) as f:
+            self._reader = reader = ControlCodesFilter(f)
+            # The fast paths build objects in C. Other layouts are read event by event, in Python.
+            if ijson.backend != "yajl2_c":
+                yield from self._read_events(reader)
+            elif self.package is None:
+                yield from self._read_items(reader)
+            elif not self.data_type["array"] and not self.data_type["concatenated"]:
+                yield from self._read_package(reader)
+            else:
+                yield from self._read_events(reader)
 
-    with open(filename, "rb") as f:
+    def _read_items(self, reader):
+        # Constructs Decimal values. https://github.com/ICRAR/ijson#options
+        for item in ijson.items(reader, _get_data_key(self.data_type), multiple_values=True, buf_size=BUFFER_SIZE):
+            if isinstance(item, dict):
+                yield OrderedDict(item)
+
+    def _read_package(self, reader):
+        member = _get_data_key(self.data_type).removesuffix(".item")
+
+        # The first map built is the package. The other maps are new dicts. This avoids Python code per map.
+        package = {}
+        map_type = functools.partial(next, itertools.chain([package], map(dict, itertools.repeat(()))))
+        coroutine = ijson.items_coro(sendable_list(), "", map_type=map_type)
+
+        while chunk := reader.read(BUFFER_SIZE):
+            coroutine.send(chunk)
+            self.package = {key: value for key, value in package.items() if key != member}
+
+            # Yield the items that are built so far, except the last, which might be incomplete, and release them.
+            items = package.get(member)
+            if isinstance(items, list) and len(items) > 1:
+                batch = items[:-1]
+                del items[:-1]
+                yield from (OrderedDict(item) for item in batch if isinstance(item, dict))
+
+        coroutine.close()
+
+        items = package.get(member)
+        if isinstance(items, list):
+            yield from (OrderedDict(item) for item in items if isinstance(item, dict))
+            items.clear()
+
+    def _read_events(self, reader):
+        package_key = "item" if self.data_type["array"] else ""
+        data_key = _get_data_key(self.data_type)
+        package_data_key = data_key.removesuffix(".item")
+
+        build_package = False
+        # Whether the first package has been read.
+        package_done = self.package is None
+        package_builder = ObjectBuilder()
         build = False
         builder = ObjectBuilder()
 
         # Constructs Decimal values. https://github.com/ICRAR/ijson#options
-        for prefix, event, value in ijson.parse(ControlCodesFilter(f), multiple_values=True):
+        for prefix, event, value in ijson.parse(reader, multiple_values=True, buf_size=BUFFER_SIZE):
             if prefix == data_key:
                 # Start of an item of data.
                 if event == "start_map":
@@ -317,70 +551,274 @@ def _read_data_from_file(filename, data_type):
 
             if build:
                 builder.event(event, value)
+                continue
+
+            if package_done:
+                continue
+
+            if prefix == package_key:
+                # Start of package.
+                if event == "start_map":
+                    build_package = True
+                    package_builder = ObjectBuilder()
+                # End of package.
+                elif event == "end_map":
+                    build_package = False
+                    package_done = True
+
+            if build_package and not prefix.startswith(package_data_key):
+                package_builder.event(event, value)
+                # The container is created by the first event, and is then filled in place.
+                self.package = package_builder.value
+
+
+def _update_package_data(collection_files, old, new):
+    for collection_file in collection_files:
+        if collection_file:
+            # A collection has a single format, and only packages have package data.
+            collection_file.record_set.update(package_data=new)
+            collection_file.release_set.update(package_data=new)
+
+    # Without deduplication, the outdated row is referenced by no other rows. With deduplication, it might be, so it is
+    # left for the deleteorphan command.
+    if not settings.DEDUPLICATE_DATA:
+        old.delete()
+
+
+def _get_loaded_package_data(collection_file, data_type):
+    # A collection has a single format, and only packages have package data.
+    match data_type["format"]:
+        case Format.record_package:
+            items = collection_file.record_set
+        case Format.release_package:
+            items = collection_file.release_set
+        case _:
+            return None
+
+    if item := items.select_related("package_data").order_by("pk").first():
+        return item.package_data
+    return None
+
+
+def _read_batches(reader, skip=0):
+    """
+    Yield each batch of items, with a copy of the package metadata, if it is read before or during the batch.
+
+    The copy is made in the thread that reads the file, because the reader modifies the package metadata as it reads.
+    Once package metadata is yielded, ``None`` is yielded instead.
+
+    A batch has up to ``BULK_CREATE_BATCH_SIZE`` items, and ends once its items exceed ``BULK_CREATE_BATCH_BYTES``
+    bytes in the file, so that memory use doesn't depend on the size of items.
+
+    The first ``skip`` items are read but not yielded.
+    """
+    releases_or_records = iter(reader)
+    # Read the skipped items, before counting bytes.
+    next(islice(releases_or_records, skip, skip), None)
+
+    max_bytes = settings.BULK_CREATE_BATCH_BYTES or math.inf
+    copied = False
+    while True:
+        start = reader.bytes_read
+        release_or_record_batch = []
+        for release_or_record in releases_or_records:
+            release_or_record_batch.append(release_or_record)
+            if (
+                len(release_or_record_batch) >= settings.BULK_CREATE_BATCH_SIZE
+                or reader.bytes_read - start >= max_bytes
+            ):
+                break
+        if not release_or_record_batch:
+            return
+
+        package = None
+        if not copied and reader.package is not None:
+            package = copy.deepcopy(reader.package)
+            copied = True
+        yield release_or_record_batch, package
+
+
+def _serialize_batches(batches, *, upgrade):
+    """
+    Yield each batch of items and package metadata, with the serialized items, upgraded items and upgrade warnings.
+
+    The serialized upgraded items are ``None``, unless ``upgrade``. If ``upgrade`` and the ``FILE_WORKER_PROCESSES``
+    setting is set, batches are upgraded and serialized in a process pool, while earlier batches are stored.
+
+    Items are serialized canonically only if they are hashed, with deduplication.
+    """
+    canonical = settings.DEDUPLICATE_DATA
+
+    if not upgrade or not settings.FILE_WORKER_PROCESSES:
+        for release_or_record_batch, package in batches:
+            yield (
+                release_or_record_batch,
+                package,
+                *_serialize_batch(release_or_record_batch, upgrade=upgrade, canonical=canonical),
+            )
+        return
+
+    executor = _get_executor()
+    pending = deque()
+    for release_or_record_batch, package in batches:
+        pending.append(
+            (
+                release_or_record_batch,
+                package,
+                executor.submit(_serialize_batch, release_or_record_batch, upgrade=True, canonical=canonical),
+            )
+        )
+        # Keep each process busy, without reading the whole file into memory.
+        if len(pending) > settings.FILE_WORKER_PROCESSES:
+            release_or_record_batch, package, future = pending.popleft()
+            yield release_or_record_batch, package, *future.result()
+    for release_or_record_batch, package, future in pending:
+        yield release_or_record_batch, package, *future.result()
+
+
+def _serialize_batch(release_or_record_batch, *, upgrade, canonical):
+    serialize = functools.partial(canonical_json, floats=False) if canonical else serialize_json
+
+    serialized = [serialize(release_or_record) for release_or_record in release_or_record_batch]
+    if not upgrade:
+        return serialized, None, ""
+
+    # upgrade_10_11() modifies the items in-place, after they are serialized.
+    with capture_warnings("ocdskit") as stream:
+        upgraded_serialized = [
+            serialize(upgrade_10_11(release_or_record, reorder=False)) for release_or_record in release_or_record_batch
+        ]
+    return serialized, upgraded_serialized, stream.getvalue()
+
+
+@functools.lru_cache
+def _get_executor():
+    # The worker has threads, so processes are spawned, not forked. Django is set up, to unpickle the function.
+    return ProcessPoolExecutor(
+        settings.FILE_WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"), initializer=django.setup
+    )
 
 
-def _store_data(collection_file, package, releases_or_records, data_type, *, upgrade=False):
+def _get_model_and_columns(data_type):
+    # A collection has a single format.
+    match data_type["format"]:
+        case Format.record_package:
+            return Record, ("collection_id", "collection_file_id", "package_data_id", "data_id", "ocid")
+        case Format.release_package:
+            return Release, (
+                "collection_id",
+                "collection_file_id",
+                "package_data_id",
+                "data_id",
+                "ocid",
+                "release_id",
+                "release_date",
+            )
+        case Format.compiled_release:
+            return CompiledRelease, ("collection_id", "collection_file_id", "data_id", "ocid", "release_date")
+
+
+def _reuse_loaded_file(collection_file, upgraded_collection_file, data_type, hash_md5):
+    """
+    Copy the items of an identical file in a completed collection, instead of loading the file.
+
+    :returns: whether an identical file was found
+    """
+    source = (
+        CollectionFile.objects.filter(
+            hash_md5=hash_md5,
+            collection__completed_at__isnull=False,
+            collection__deleted_at=None,
+            collection__data_type__format=data_type["format"],
+        )
+        .order_by("-pk")
+        .first()
+    )
+    if source is None:
+        return False
+
+    pairs = [(source, collection_file)]
+    if upgraded_collection_file:
+        upgraded_source = CollectionFile.objects.filter(
+            collection__parent=source.collection_id,
+            collection__transform_type=Collection.Transform.UPGRADE_10_11,
+            collection__deleted_at=None,
+            filename=source.filename,
+        ).first()
+        if upgraded_source is None:
+            return False
+        pairs.append((upgraded_source, upgraded_collection_file))
+
+    model, columns = _get_model_and_columns(data_type)
+    table = sql.Identifier(model._meta.db_table)
+    # Columns other than collection_id and collection_file_id.
+    copied = sql.SQL(", ").join(map(sql.Identifier, columns[2:]))
+
+    counts = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        # If another delivery of the same message stored items meanwhile, load the file, which skips these items.
+        if (
+            CollectionFile.objects.select_for_update()
+            .values_list("loaded_items_count", flat=True)
+            .get(pk=collection_file.pk)
+        ):
+            return False
+        for source_file, target_file in pairs:
+            cursor.execute(
+                sql.SQL(
+                    "INSERT INTO {table} (collection_id, collection_file_id, {copied}) "
+                    "SELECT %s, %s, {copied} FROM {table} WHERE collection_file_id = %s ORDER BY id"
+                ).format(table=table, copied=copied),
+                [target_file.collection_id, target_file.pk, source_file.pk],
+            )
+            counts.append((target_file.collection_id, model, cursor.rowcount))
+        CollectionFile.objects.filter(pk=collection_file.pk).update(
+            loaded_items_count=source.loaded_items_count, hash_md5=hash_md5
+        )
+        add_counts(counts)
+
+    collection_file.loaded_items_count = source.loaded_items_count
+    logger.info("Copied collection_file %s from identical collection_file %s", collection_file.pk, source.pk)
+    return True
+
+
+def _store_data(collection_file, package_data, release_or_record_batch, data_type, serialized):
+    """
+    Store the items of a batch. The caller adds to the collection's counts.
+
+    :returns: the number of items stored
+    """
     collection = collection_file.collection
-    package_data = get_or_create(PackageData, package) if package is not None else None
 
-    # With deduplication, each Data row is looked up or created individually (batch size 1).
-    batch_size = 1 if settings.DEDUPLICATE_DATA else settings.BULK_CREATE_BATCH_SIZE
+    # COPY is faster than INSERT, but can't skip conflicting rows, so it's used only without deduplication.
+    use_copy = settings.COPY_DATA and not settings.DEDUPLICATE_DATA
 
-    while release_or_record_batch := list(islice(releases_or_records, batch_size)):
-        if upgrade:
-            upgraded_releases_or_records = []
-            for release_or_record in release_or_record_batch:
-                with create_logger_note(collection, "ocdskit"):
-                    upgraded_releases_or_records.append(upgrade_10_11(release_or_record, reorder=False))
-            release_or_record_batch = upgraded_releases_or_records
+    model, columns = _get_model_and_columns(data_type)
 
-        if settings.DEDUPLICATE_DATA:
-            data_objects = [get_or_create(Data, data) for data in release_or_record_batch]
-        else:
-            data_objects = [Data(hash_md5="", data=data) for data in release_or_record_batch]
-            Data.objects.bulk_create(data_objects)
-
-        rows = []
-        for release_or_record, data in zip(release_or_record_batch, data_objects, strict=True):
-            # The ocid is required to find all the releases relating to the same record, during compilation.
-            if "ocid" not in release_or_record:
-                logger.error("Skipped release or record without ocid: %s", release_or_record)
-                continue
+    data_ids = bulk_copy(Data, serialized) if use_copy else bulk_get_or_create_ids(Data, serialized)
 
-            match data_type["format"]:
-                case Format.record_package:
-                    rows.append(
-                        Record(
-                            collection=collection,
-                            collection_file=collection_file,
-                            package_data=package_data,
-                            data=data,
-                            ocid=release_or_record["ocid"],
-                        )
-                    )
-                case Format.release_package:
-                    rows.append(
-                        Release(
-                            collection=collection,
-                            collection_file=collection_file,
-                            package_data=package_data,
-                            data=data,
-                            ocid=release_or_record["ocid"],
-                            release_id=release_or_record.get("id") or "",
-                            release_date=release_or_record.get("date") or "",
-                        )
-                    )
-                case Format.compiled_release:
-                    rows.append(
-                        CompiledRelease(
-                            collection=collection,
-                            collection_file=collection_file,
-                            data=data,
-                            ocid=release_or_record["ocid"],
-                            release_date=release_or_record.get("date") or "",
-                        )
-                    )
+    rows = []
+    for release_or_record, data_id in zip(release_or_record_batch, data_ids, strict=True):
+        # The ocid is required to find all the releases relating to the same record, during compilation.
+        if "ocid" not in release_or_record:
+            logger.error("Skipped release or record without ocid: %s", release_or_record)
+            continue
+
+        values = {
+            "collection_id": collection.pk,
+            "collection_file_id": collection_file.pk,
+            "package_data_id": package_data and package_data.pk,
+            "data_id": data_id,
+            "ocid": release_or_record["ocid"],
+            "release_id": release_or_record.get("id") or "",
+            "release_date": release_or_record.get("date") or "",
+        }
+        rows.append({column: values[column] for column in columns})
+
+    if rows:
+        if use_copy:
+            copy_rows(model, columns, (tuple(row.values()) for row in rows))
+        else:
+            model.objects.bulk_create([model(**row) for row in rows])
 
-        if rows:
-            # A collection has a single format.
-            type(rows[0]).objects.bulk_create(rows)
+    return len(rows)
@@ -1,16 +1,18 @@
+import functools
 import logging
 import threading
-import time
+from collections import OrderedDict
 
 from django.core.management.base import BaseCommand
 from django.db import transaction
+from django.db.models import Sum
 from django.db.models.functions import Now
 from django.utils.translation import gettext as t
 from ocdskit.util import Format
-from yapw.methods import ack, nack
+from yapw.methods import ack, add_callback_threadsafe, nack
 
-from process.models import Collection
-from process.util import consume, decorator
+from process.models import Collection, CollectionCount
+from process.util import COUNT_FIELDS, consume, decorator
 from process.util import wrap as w
 
 # Read all messages that might be the final message. "file_worker" can be the final message if neither checking nor
@@ -26,7 +28,14 @@ consume_routing_keys = [
 routing_key = "finisher"
 logger = logging.getLogger(__name__)
 lock = threading.Lock()
-requeued = set()
+# The collections for which a message was requeued. The least recently requeued are forgotten, to bound memory use. If
+# a forgotten collection is not yet completed, its next message is requeued, which costs only another check.
+requeued = OrderedDict()
+REQUEUED_MAX_SIZE = 10000
+# The collections whose requeued message is being checked, or is waiting to be checked again.
+checking = set()
+# The number of seconds to wait before checking again whether a collection is completable, to prevent churning.
+RECHECK_DELAY = 30
 
 
 class Command(BaseCommand):
@@ -43,74 +52,120 @@ def callback(client_state, channel, method, properties, input_message):
 
     # Run queries only for redelivered messages.
     if method.redelivered:
-        try:
-            collection = Collection.objects.get(pk=collection_id)
-        except Collection.DoesNotExist:
-            ack(client_state, channel, method.delivery_tag)
-            return
-        if collection.deleted_at:
-            ack(client_state, channel, method.delivery_tag)
-            return
-
-        if completable(collection):
-            # COUNT first, before any UPDATE, to avoid locking the collection row in between UPDATEs.
-            counts = _count_releases_and_records(collection)
-            # If not for the lock, we'd COUNT only if `updated`, to save time on simultaneous messages.
-            if upgraded_collection := collection.get_upgraded_collection():
-                upgraded_collection_counts = _count_releases_and_records(upgraded_collection)
-            else:
-                upgraded_collection_counts = {}
-
-            with transaction.atomic():
-                if collection.transform_type == Collection.Transform.COMPILE_RELEASES:
-                    kwargs = {"store_end_at": Now()}
-                else:
-                    kwargs = {}
-
-                updated = _set_complete_at(collection, **counts, **kwargs)
-                if updated and upgraded_collection:
-                    _set_complete_at(upgraded_collection, **upgraded_collection_counts)
-
-        # If the collection isn't completable or completed, try again after a delay, to prevent churning.
-        elif not collection.completed_at:
-            # RabbitMQ won't deliver another message until ack'd, so blocking the thread with time.sleep() is
-            # effectively the same as not blocking the thread with client_state.connection.ioloop.call_later().
-            time.sleep(30)
-
-            # Note: Need to monitor the queue, in case a message gets stuck.
-            # Log the collection for administrators to use in the cancelcollection command.
-            logger.info("Collection %s requeued", collection)
+        # Coalesce the checks for a collection. If a message for the collection is being checked, or is waiting to be
+        # checked again, ack this message. (Many messages are redelivered if the worker restarts.)
+        with lock:
+            if collection_id in checking:
+                ack(client_state, channel, method.delivery_tag)
+                return
+            checking.add(collection_id)
 
-            nack(client_state, channel, method.delivery_tag, requeue=True)
+        recheck = False
+        try:
+            recheck = _complete(collection_id)
+        finally:
+            if not recheck:
+                with lock:
+                    checking.discard(collection_id)
+
+        if recheck:
+            # Requeue the message after a delay, without blocking the thread (unlike time.sleep()), so that other
+            # collections' messages are processed meanwhile.
+            delayed = functools.partial(_requeue, client_state, channel, method.delivery_tag, collection_id)
+            connection = client_state.connection
+            add_callback_threadsafe(
+                connection, functools.partial(connection.ioloop.call_later, RECHECK_DELAY, delayed)
+            )
             return
 
     # If no message has yet been requeued for the collection, track the collection and requeue the message.
     elif collection_id not in requeued:  # no lock at first, for performance
         # Use a lock and re-do the check, to prevent multiple requeues within each collection.
-        # If the collections were known in advance, we could use a non-blocking lock for each collection.
         with lock:
             if collection_id not in requeued:
-                requeued.add(collection_id)
+                requeued[collection_id] = None
+                if len(requeued) > REQUEUED_MAX_SIZE:
+                    requeued.popitem(last=False)
                 nack(client_state, channel, method.delivery_tag, requeue=True)
                 return
 
     ack(client_state, channel, method.delivery_tag)
 
 
+def _complete(collection_id):
+    """
+    Set the collection as completed, if completable.
+
+    :returns: whether to check again later, because the collection is neither completable nor completed
+    """
+    try:
+        collection = Collection.objects.get(pk=collection_id)
+    except Collection.DoesNotExist:
+        return False
+    if collection.deleted_at:
+        return False
+
+    if completable(collection):
+        # COUNT first, before any UPDATE, to avoid locking the collection row in between UPDATEs.
+        counts = _count_releases_and_records(collection)
+        # If not for the lock, we'd COUNT only if `updated`, to save time on simultaneous messages.
+        if upgraded_collection := collection.get_upgraded_collection():
+            upgraded_collection_counts = _count_releases_and_records(upgraded_collection)
+        else:
+            upgraded_collection_counts = {}
+
+        with transaction.atomic():
+            if collection.transform_type == Collection.Transform.COMPILE_RELEASES:
+                kwargs = {"store_end_at": Now()}
+            else:
+                kwargs = {}
+
+            updated = _set_complete_at(collection, **counts, **kwargs)
+            if updated and upgraded_collection:
+                _set_complete_at(upgraded_collection, **upgraded_collection_counts)
+
+        return False
+
+    if collection.completed_at:
+        return False
+
+    # Note: Need to monitor the queue, in case a message gets stuck.
+    # Log the collection for administrators to use in the cancelcollection command.
+    logger.info("Collection %s requeued", collection)
+    return True
+
+
+def _requeue(client_state, channel, delivery_tag, collection_id):
+    # Run in the connection's thread, after the delay.
+    with lock:
+        checking.discard(collection_id)
+    nack(client_state, channel, delivery_tag, requeue=True)
+
+
 def _count_releases_and_records(collection):
-    # all() avoids cached calls in count().
-    # https://docs.djangoproject.com/en/5.2/ref/models/querysets/#all
-    # https://docs.djangoproject.com/en/5.2/ref/models/querysets/#count
-    return {
-        "cached_releases_count": collection.release_set.all().count(),
-        "cached_records_count": collection.record_set.all().count(),
-        "cached_compiled_releases_count": collection.compiledrelease_set.all().count(),
-    }
+    # Workers add to the counts in the collection_count table as they store rows. A count is NULL only if the
+    # collection started loading before then, in which case the rows are counted.
+    deltas = CollectionCount.objects.filter(collection=collection).aggregate(
+        **{field: Sum(field, default=0) for field in COUNT_FIELDS.values()}
+    )
+
+    counts = {}
+    for model, field in COUNT_FIELDS.items():
+        cached_field = f"cached_{field}_count"
+        if (cached := getattr(collection, cached_field)) is None:
+            counts[cached_field] = model.objects.filter(collection=collection).count()
+        else:
+            counts[cached_field] = cached + deltas[field]
+    return counts
 
 
 def _set_complete_at(collection, **kwargs):
     # Use optimistic locking to update the collections.
-    return Collection.objects.filter(pk=collection.pk, completed_at=None).update(completed_at=Now(), **kwargs)
+    updated = Collection.objects.filter(pk=collection.pk, completed_at=None).update(completed_at=Now(), **kwargs)
+    # The counts are added to the collection.
+    if updated:
+        CollectionCount.objects.filter(collection=collection).delete()
+    return updated
 
 
 def completable(collection):
@@ -4,16 +4,15 @@ from argparse import RawDescriptionHelpFormatter
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
 from django.db.models.functions import Now
 from django.utils.translation import gettext as t
 from django.utils.translation import gettext_lazy as _
 
 from process.exceptions import InvalidFormError
 from process.models import Collection
-from process.processors.loader import create_collection_file, create_collections, file_or_directory
+from process.processors.loader import bulk_create_collection_files, create_collections, file_or_directory
 from process.scrapyd import configured
-from process.util import get_publisher, walk
+from process.util import get_publisher, split_file, walk
 from process.util import wrap as w
 
 routing_key = "loader"
@@ -28,10 +27,15 @@ class Command(BaseCommand):
             'The collection is automatically "closed" to new files. Use --keep-open to keep the collection open for '
             "future file additions.\n\n"
             "All files must have the same encoding (default UTF-8).\n\n"
+            "Files can be compressed (.bz2, .gz, .xz, .zst). Each file in an archive (.zip, .tar, .tar.gz, etc.) is "
+            "loaded as its own collection file. Large files are split into chunks, if FILE_CHUNK_SIZE is set.\n\n"
             "The formats of files are automatically detected (release package, record package, release, record, "
             "compiled release), including JSON arrays and concatenated JSON of these.\n\n"
             "Additional processing is not automatically configured (upgrading, merging, checking, etc.). To add a "
-            "step, use --upgrade, --compile and/or --check."
+            "step, use --upgrade, --compile and/or --check.\n\n"
+            "With --incremental-from, releases and records whose data is unchanged since the given collection "
+            "reference the given collection's data, through deduplication, instead of storing the data again. Every "
+            "release and record is still read and stored as a row."
         )
     )
 
@@ -74,6 +78,18 @@ class Command(BaseCommand):
         parser.add_argument(
             "-k", "--keep-open", action="store_true", help=_("keep collection open for future file additions")
         )
+        parser.add_argument(
+            "--incremental-from",
+            type=int,
+            metavar="COLLECTION_ID",
+            help=_("store only the data that is new or changed since this collection of the source"),
+        )
+        parser.add_argument(
+            "--priority",
+            type=int,
+            default=0,
+            help=_("consume the collection's messages before those of collections of lower priority (default 0)"),
+        )
 
     def handle(self, *args, **options):
         self.stderr.style_func = None
@@ -85,8 +101,8 @@ class Command(BaseCommand):
                 )
             )
 
-        # create proper data_version
-        mtimes = [os.path.getmtime(path) for path in walk(options["PATH"])]
+        # create proper data_version. Archives aren't opened, since members have the archive's modification time.
+        mtimes = [os.path.getmtime(path) for path in walk(options["PATH"], expand=False)]
         if not mtimes:
             raise CommandError(_("No files found"))
 
@@ -115,6 +131,8 @@ class Command(BaseCommand):
                 # Other
                 note=options["note"],
                 force=options["force"],
+                incremental_from=options["incremental_from"],
+                priority=options["priority"],
             )
         except InvalidFormError as e:
             if any(error.code == "unique_collection" for error_list in e.errors.values() for error in error_list):
@@ -142,16 +160,22 @@ class Command(BaseCommand):
 
         self.stderr.write(f"Processing files: {' '.join(options['PATH'])}")
 
+        filenames = (filename for path in walk(options["PATH"]) for filename in split_file(path))
+
         with get_publisher() as client:
-            for path in walk(options["PATH"]):
-                # The transaction is inside the loop, since we can't rollback RabbitMQ messages, only PostgreSQL
-                # statements. This ensures that any published message is paired with a database commit.
-                with transaction.atomic():
-                    self.stderr.write(f"Storing file: {path}")
-                    collection_file = create_collection_file(collection, filename=path)
-
-                message = {"collection_id": collection.pk, "collection_file_id": collection_file.pk}
-                client.publish(message, routing_key=routing_key)
+            # Each batch is committed before it is yielded, since we can't rollback RabbitMQ messages, only PostgreSQL
+            # statements. This ensures that any published message is paired with a database commit.
+            for collection_files in bulk_create_collection_files(collection, filenames):
+                for collection_file in collection_files:
+                    self.stderr.write(f"Storing file: {collection_file.filename}")
+
+                client.publish_many(
+                    (
+                        ({"collection_id": collection.pk, "collection_file_id": collection_file.pk}, routing_key)
+                        for collection_file in collection_files
+                    ),
+                    priority=collection.priority,
+                )
 
         if not options["keep_open"]:
             collection.store_end_at = Now()
@@ -5,12 +5,12 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils.translation import gettext as t
 from ocdskit.util import is_linked_release
-from yapw.methods import ack, publish
+from yapw.methods import ack
 
 from process.exceptions import AlreadyExists
 from process.models import Collection, CollectionNote, CompiledRelease, ProcessingStep, Record
 from process.processors.compiler import compile_releases_by_ocdskit, save_compiled_release
-from process.util import consume, create_note, decorator, deleting_step
+from process.util import consume, create_note, decorator, deleting_step, publish
 from process.util import wrap as w
 
 consume_routing_keys = ["compiler_record"]
@@ -42,7 +42,8 @@ def callback(client_state, channel, method, properties, input_message):
     ):
         compile_record(compiled_collection, ocid)
 
-    publish(client_state, channel, {"collection_id": compiled_collection_id}, routing_key)
+    message = {"collection_id": compiled_collection_id}
+    publish(client_state, channel, message, routing_key, priority=compiled_collection.priority)
 
     ack(client_state, channel, method.delivery_tag)
 
@@ -3,11 +3,11 @@ import logging
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils.translation import gettext as t
-from yapw.methods import ack, publish
+from yapw.methods import ack
 
 from process.models import Collection, ProcessingStep
-from process.processors.compiler import compile_release_batch
-from process.util import consume, decorator
+from process.processors.compiler import compile_release_batch, compile_release_range
+from process.util import consume, decorator, publish
 from process.util import wrap as w
 
 consume_routing_keys = ["compiler_release"]
@@ -25,7 +25,6 @@ class Command(BaseCommand):
 
 
 def callback(client_state, channel, method, properties, input_message):
-    ocids = input_message["ocids"]
     compiled_collection_id = input_message["compiled_collection_id"]
 
     compiled_collection = Collection.objects.get(pk=compiled_collection_id)
@@ -34,11 +33,19 @@ def callback(client_state, channel, method, properties, input_message):
         return
 
     with transaction.atomic():
-        compile_release_batch(compiled_collection, ocids)
-        ProcessingStep.objects.filter(
-            name=ProcessingStep.Name.COMPILE, collection_id=compiled_collection_id, ocid__in=ocids
-        ).delete()
-
-    publish(client_state, channel, {"collection_id": compiled_collection_id}, routing_key)
+        steps = ProcessingStep.objects.filter(name=ProcessingStep.Name.COMPILE, collection_id=compiled_collection_id)
+        # The compiler worker creates one step per range, by its upper bound.
+        if "ocid_range" in input_message:
+            after, upto = input_message["ocid_range"]
+            compile_release_range(compiled_collection, after, upto)
+            steps.filter(ocid=upto).delete()
+        # Messages published before ranges have batches of OCIDs, with one step per batch or one step per OCID.
+        else:
+            ocids = input_message["ocids"]
+            compile_release_batch(compiled_collection, ocids)
+            steps.filter(ocid__in=ocids).delete()
+
+    message = {"collection_id": compiled_collection_id}
+    publish(client_state, channel, message, routing_key, priority=compiled_collection.priority)
 
     ack(client_state, channel, method.delivery_tag)
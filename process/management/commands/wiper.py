@@ -38,6 +38,7 @@ def delete_collection(collection_id):
         ("processing_step", None),  # references collection_file
         ("collection_file", None),
         ("collection_note", None),
+        ("collection_count", None),
     ]
 
     if settings.ENABLE_CHECKER:
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.14 on 2026-10-18 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0049_collection_compilation_enqueued"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collectionfile",
+            name="loaded_items_count",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.14 on 2026-10-18 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0050_collectionfile_loaded_items_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collectionfile",
+            name="hash_md5",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddIndex(
+            model_name="collectionfile",
+            index=models.Index(
+                condition=models.Q(("hash_md5", ""), _negated=True),
+                fields=["hash_md5"],
+                name="collection_file_hash_md5_idx",
+            ),
+        ),
+    ]
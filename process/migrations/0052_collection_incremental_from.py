@@ -0,0 +1,29 @@
+# Generated by Django 5.2.14 on 2026-10-18 05:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0051_collectionfile_hash_md5"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collection",
+            name="incremental_from",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="incremental_collections",
+                to="process.collection",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="collection",
+            index=models.Index(fields=["incremental_from"], name="collection_incremental_from_id_idx"),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.14 on 2026-10-18 05:33
+
+import simplejson.encoder
+from django.db import migrations
+
+import process.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0052_collection_incremental_from"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="collection",
+            name="data_type",
+            field=process.models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name="collection",
+            name="options",
+            field=process.models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name="collection",
+            name="steps",
+            field=process.models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name="collectionnote",
+            name="data",
+            field=process.models.JSONField(blank=True, default=dict, encoder=simplejson.encoder.JSONEncoder),
+        ),
+        migrations.AlterField(
+            model_name="data",
+            name="data",
+            field=process.models.JSONField(encoder=simplejson.encoder.JSONEncoder),
+        ),
+        migrations.AlterField(
+            model_name="packagedata",
+            name="data",
+            field=process.models.JSONField(encoder=simplejson.encoder.JSONEncoder),
+        ),
+        migrations.AlterField(
+            model_name="recordcheck",
+            name="cove_output",
+            field=process.models.JSONField(),
+        ),
+        migrations.AlterField(
+            model_name="releasecheck",
+            name="cove_output",
+            field=process.models.JSONField(),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.14 on 2026-10-18 05:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0053_jsonfield_orjson"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="collection",
+            name="priority",
+            field=models.PositiveSmallIntegerField(blank=True, default=0),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.14 on 2026-10-18 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0054_collection_priority"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="collection",
+            name="cached_compiled_releases_count",
+            field=models.IntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name="collection",
+            name="cached_records_count",
+            field=models.IntegerField(blank=True, default=0, null=True),
+        ),
+        migrations.AlterField(
+            model_name="collection",
+            name="cached_releases_count",
+            field=models.IntegerField(blank=True, default=0, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.14 on 2026-10-18 06:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0055_collection_cached_counts_default"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CollectionCount",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("slot", models.PositiveSmallIntegerField()),
+                ("releases", models.IntegerField(default=0)),
+                ("records", models.IntegerField(default=0)),
+                ("compiled_releases", models.IntegerField(default=0)),
+                (
+                    "collection",
+                    models.ForeignKey(
+                        db_index=False, on_delete=django.db.models.deletion.CASCADE, to="process.collection"
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "collection_count",
+                "constraints": [
+                    models.UniqueConstraint(fields=("collection", "slot"), name="unique_collection_count_identifiers")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.14 on 2026-10-18 06:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("process", "0056_collectioncount"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="collection",
+            name="incremental_from",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="incremental_collections",
+                to="process.collection",
+            ),
+        ),
+    ]
@@ -1,9 +1,13 @@
+from decimal import Decimal
 from typing import Self
 
+import orjson
+import simplejson as json
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from psycopg.types.json import Jsonb
 
 # DjangoJSONEncoder serializes Decimal values as strings. simplejson serializes Decimal values as numbers.
 from simplejson import JSONEncoder
@@ -27,6 +31,56 @@ class Default(dict):
         return value
 
 
+# orjson loads integers beyond 64 bits as float values. Integers with fewer than 19 digits are within 64 bits. To find
+# 19 consecutive digits quickly (a regular expression is as slow as parsing), translate all digits to zeros.
+DIGITS_TO_ZEROS = bytes.maketrans(b"123456789", b"000000000")
+LONG_DIGITS = b"0" * 19
+
+
+def json_default(obj):
+    """Serialize Decimal values as numbers, like simplejson's ``use_decimal``. Use as orjson's ``default``."""
+    if isinstance(obj, Decimal):
+        return orjson.Fragment(str(obj))
+    raise TypeError
+
+
+class JSONField(models.JSONField):
+    """
+    A JSONField that dumps and loads ``jsonb`` values with orjson, which is much faster than the json module.
+
+    Decimal values are dumped as numbers, like simplejson's ``JSONEncoder``. Numbers are loaded as int and float
+    values, like the json module. If orjson fails or might lose precision (for example, for integers beyond 64 bits),
+    the field falls back to its ``encoder`` and ``decoder``.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if not isinstance(value, str) or self.decoder:
+            return super().from_db_value(value, expression, connection)
+        encoded = value.encode()
+        if LONG_DIGITS in encoded.translate(DIGITS_TO_ZEROS):
+            return super().from_db_value(value, expression, connection)
+        try:
+            return orjson.loads(encoded)
+        except orjson.JSONDecodeError:
+            return super().from_db_value(value, expression, connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):  # noqa: FBT002 # Django
+        # Django prepares expressions, like Value() or F(), which orjson can't dump.
+        if hasattr(value, "resolve_expression") or hasattr(value, "as_sql"):
+            return super().get_db_prep_value(value, connection, prepared)
+        if not prepared:
+            value = self.get_prep_value(value)
+        return Jsonb(value, dumps=self._dumps)
+
+    def _dumps(self, value):
+        try:
+            # Datetimes are passed through to the encoder, like before, instead of being formatted by orjson.
+            return orjson.dumps(value, default=json_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        # For example, integers beyond 64 bits, strings with lone surrogates, or types that only the encoder supports.
+        except orjson.JSONEncodeError:
+            return json.dumps(value, cls=self.encoder)
+
+
 class Collection(models.Model):
     """
     A collection of data from a source.
@@ -52,12 +106,15 @@ class Collection(models.Model):
     sample = models.BooleanField(default=False)
 
     # Process Manager pattern
-    steps = models.JSONField(blank=True, default=list)
-    options = models.JSONField(blank=True, default=dict)
+    steps = JSONField(blank=True, default=list)
+    options = JSONField(blank=True, default=dict)
     expected_files_count = models.IntegerField(null=True, blank=True)
+    # Messages about the collection are consumed before messages about collections of lower priority, if
+    # RABBIT_MAX_PRIORITY is set.
+    priority = models.PositiveSmallIntegerField(default=0, blank=True)
 
     # Internal state
-    data_type = models.JSONField(blank=True, default=dict)
+    data_type = JSONField(blank=True, default=dict)
     compilation_started = models.BooleanField(default=False)
     compilation_enqueued = models.BooleanField(default=False)
 
@@ -72,11 +129,23 @@ class Collection(models.Model):
     )
     transform_type = models.TextField(blank=True, choices=Transform)
     scrapyd_job = models.TextField(blank=True)
+    # The collection of the same source, whose data the collection's unchanged releases and records reference, through
+    # deduplication.
+    # Each collection has all its rows, so the base collection can be deleted.
+    incremental_from = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="incremental_collections",
+    )
 
-    # Calculated fields
-    cached_releases_count = models.IntegerField(null=True, blank=True)
-    cached_records_count = models.IntegerField(null=True, blank=True)
-    cached_compiled_releases_count = models.IntegerField(null=True, blank=True)
+    # Calculated fields. Workers add to the counts in the collection_count table, which the finisher worker adds here.
+    # See process.util.add_counts().
+    cached_releases_count = models.IntegerField(default=0, null=True, blank=True)
+    cached_records_count = models.IntegerField(default=0, null=True, blank=True)
+    cached_compiled_releases_count = models.IntegerField(default=0, null=True, blank=True)
 
     # Lifecycle
     store_start_at = models.DateTimeField(auto_now_add=True)
@@ -89,6 +158,7 @@ class Collection(models.Model):
         indexes = [
             # ForeignKey with db_index=False.
             models.Index(name="collection_transform_from_collection_id_idx", fields=["parent"]),
+            models.Index(name="collection_incremental_from_id_idx", fields=["incremental_from"]),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -152,6 +222,24 @@ class Collection(models.Model):
                     code="transform_duplicated",
                 )
 
+        if self.incremental_from:
+            if self.incremental_from.deleted_at:
+                message = _("Base collection %(id)s is being deleted")
+                raise ValidationError(
+                    {"incremental_from": ValidationError(message, params=self.incremental_from.__dict__)},
+                    code="incremental_from_deleted",
+                )
+
+            if (
+                self.incremental_from.source_id != self.source_id
+                or self.incremental_from.transform_type != self.transform_type
+            ):
+                message = _("Base collection %(id)s doesn't have the same source and transform type")
+                raise ValidationError(
+                    {"incremental_from": ValidationError(message, params=self.incremental_from.__dict__)},
+                    code="incremental_from_invalid",
+                )
+
     def get_upgraded_collection(self) -> Self | None:
         """Return the upgraded collection or None."""
         # This is a shortcut to avoid a query. Per clean_fields(), only the original collection can be upgraded.
@@ -188,7 +276,7 @@ class CollectionNote(models.Model):
 
     collection = models.ForeignKey(Collection, on_delete=models.CASCADE, db_index=False)
     note = models.TextField()
-    data = models.JSONField(encoder=JSONEncoder, blank=True, default=dict)
+    data = JSONField(encoder=JSONEncoder, blank=True, default=dict)
     stored_at = models.DateTimeField(auto_now_add=True)
     code = models.TextField(blank=True, choices=Level)
 
@@ -211,12 +299,17 @@ class CollectionFile(models.Model):
     filename = models.TextField(blank=True)
     url = models.TextField(blank=True)
     compilation_started = models.BooleanField(default=False)  # unused for "release package" collections
+    # The number of releases or records that the file_worker worker committed, to resume loading from.
+    loaded_items_count = models.IntegerField(default=0)
+    # The MD5 hash of the file's bytes, once loaded, to reuse its rows for an identical file. See REUSE_FILES.
+    hash_md5 = models.TextField(blank=True)
 
     class Meta:
         db_table = "collection_file"
         indexes = [
             # ForeignKey with db_index=False.
             models.Index(name="collection_file_collection_id_idx", fields=["collection"]),
+            models.Index(name="collection_file_hash_md5_idx", fields=["hash_md5"], condition=~models.Q(hash_md5="")),
         ]
         constraints = [
             models.UniqueConstraint(name="unique_collection_file_identifiers", fields=["collection", "filename"]),
@@ -226,6 +319,29 @@ class CollectionFile(models.Model):
         return "{filename} (id: {id})".format_map(Default(filename=self.filename, id=self.pk))
 
 
+class CollectionCount(models.Model):
+    """Changes to the number of rows of a collection, not yet added to its cached counts."""
+
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, db_index=False)
+    # Concurrent workers update different rows, chosen at random, to not wait on each other's locks.
+    slot = models.PositiveSmallIntegerField()
+
+    releases = models.IntegerField(default=0)
+    records = models.IntegerField(default=0)
+    compiled_releases = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "collection_count"
+        constraints = [
+            models.UniqueConstraint(name="unique_collection_count_identifiers", fields=["collection", "slot"]),
+        ]
+
+    def __str__(self):
+        return "{collection_id}:{slot} (id: {id})".format_map(
+            Default(collection_id=self.collection_id, slot=self.slot, id=self.pk)
+        )
+
+
 class ProcessingStep(models.Model):
     """A step in the lifecycle of collection file."""
 
@@ -258,12 +374,13 @@ class Data(models.Model):
     """The contents of a release, record or compiled release."""
 
     hash_md5 = models.TextField()
-    data = models.JSONField(encoder=JSONEncoder)
+    data = JSONField(encoder=JSONEncoder)
 
     class Meta:
         db_table = "data"
         constraints = [
-            # Used by process.util.get_or_create(). The constraint is partial for the `DEDUPLICATE_DATA = False` case.
+            # Used by process.util.bulk_get_or_create_ids(). The constraint is partial for the
+            # `DEDUPLICATE_DATA = False` case.
             models.UniqueConstraint(
                 name="unique_data_hash_md5", fields=["hash_md5"], condition=~models.Q(hash_md5="")
             ),
@@ -277,12 +394,13 @@ class PackageData(models.Model):
     """The contents of a package, excluding the releases or records."""
 
     hash_md5 = models.TextField()
-    data = models.JSONField(encoder=JSONEncoder)
+    data = JSONField(encoder=JSONEncoder)
 
     class Meta:
         db_table = "package_data"
         constraints = [
-            # Used by process.util.get_or_create(). The constraint is partial for the `DEDUPLICATE_DATA = False` case.
+            # Used by process.util.bulk_get_or_create_ids(). The constraint is partial for the
+            # `DEDUPLICATE_DATA = False` case.
             models.UniqueConstraint(
                 name="unique_package_data_hash_md5", fields=["hash_md5"], condition=~models.Q(hash_md5="")
             ),
@@ -308,7 +426,7 @@ class Release(models.Model):
     class Meta:
         db_table = "release"
         indexes = [
-            # Used by process.processors.compiler.compile_release_batch().
+            # Used by the compiler worker, and by compile_release_batch() and compile_release_range().
             models.Index(fields=["collection", "ocid", "release_date"]),
             # ForeignKey with db_index=False.
             models.Index(name="release_collection_id_idx", fields=["collection"]),
@@ -368,7 +486,7 @@ class CompiledRelease(models.Model):
     class Meta:
         db_table = "compiled_release"
         indexes = [
-            # Used by compile_record() and compile_release_batch().
+            # Used by compile_record(), compile_release_batch() and compile_release_range().
             models.Index(fields=["collection", "ocid"]),
             # ForeignKey with db_index=False.
             models.Index(name="compiled_release_collection_id_idx", fields=["collection"]),
@@ -384,7 +502,7 @@ class ReleaseCheck(models.Model):
     """The result of checking a release."""
 
     release = models.OneToOneField(Release, on_delete=models.CASCADE)
-    cove_output = models.JSONField()
+    cove_output = JSONField()
 
     class Meta:
         db_table = "release_check"
@@ -397,7 +515,7 @@ class RecordCheck(models.Model):
     """The result of checking a record."""
 
     record = models.OneToOneField(Record, on_delete=models.CASCADE)
-    cove_output = models.JSONField()
+    cove_output = JSONField()
 
     class Meta:
         db_table = "record_check"
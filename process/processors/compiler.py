@@ -12,7 +12,7 @@ from ocdsmerge_rs import Merger
 from ocdsmerge_rs.exceptions import DuplicateIdValueWarning, MergeError, MergeWarning
 
 from process.models import CollectionFile, CollectionNote, CompiledRelease, Data, Release
-from process.util import create_note, get_extensions, get_or_create
+from process.util import add_counts, bulk_get_or_create, create_note, get_extensions, get_or_create
 
 logger = logging.getLogger(__name__)
 WARNING = CollectionNote.Level.WARNING
@@ -52,16 +52,66 @@ def compile_release_batch(collection, ocids):
     if not ocids:
         return []
 
-    rows = (
-        Release.objects.filter(collection_id=collection.parent_id, ocid__in=ocids)
-        .order_by("ocid", "release_date")
-        .values_list("ocid", "data__data", "package_data__data")
+    seen_ocids = set()
+    merged_batch = _merge_releases(
+        collection, Release.objects.filter(collection_id=collection.parent_id, ocid__in=ocids), seen_ocids
     )
 
+    # OCIDs with no releases do not appear in the query results.
+    for ocid in ocids:
+        if ocid not in seen_ocids:
+            create_note(collection, CollectionNote.Level.ERROR, f"OCID {ocid} has 0 releases.")
+
+    if merged_batch:
+        save_compiled_releases(collection, merged_batch)
+
+    return [ocid for ocid, _ in merged_batch]
+
+
+def compile_release_range(collection, after, upto):
+    """
+    Compile the OCIDs in a range in bulk.
+
+    Like :func:`compile_release_batch`, but the OCIDs are read from the original collection's releases, instead of
+    from the message. Ranges are disjoint, like batches.
+
+    :param collection: the compiled collection
+    :param after: the lower bound of the range (exclusive), or None
+    :param upto: the upper bound of the range (inclusive)
+    :returns: the OCIDs that were compiled
+    """
+    compiled_releases = CompiledRelease.objects.filter(collection=collection, ocid__lte=upto)
+    releases = Release.objects.filter(collection_id=collection.parent_id, ocid__lte=upto)
+    if after is not None:
+        compiled_releases = compiled_releases.filter(ocid__gt=after)
+        releases = releases.filter(ocid__gt=after)
+
+    already_exists = set(compiled_releases.values_list("ocid", flat=True))
+    for ocid in already_exists:
+        logger.error("Compiled release %s already exists in collection %s", ocid, collection)
+
+    merged_batch = _merge_releases(collection, releases.exclude(ocid__in=already_exists), set())
+
+    if merged_batch:
+        save_compiled_releases(collection, merged_batch)
+
+    return [ocid for ocid, _ in merged_batch]
+
+
+def _merge_releases(collection, queryset, seen_ocids):
+    """
+    Merge the releases of each OCID.
+
+    :param collection: the compiled collection
+    :param queryset: the releases to merge
+    :param seen_ocids: a set, to which to add the OCIDs of the releases
+    :returns: a list of ``(ocid, merged)`` pairs
+    """
+    rows = queryset.order_by("ocid", "release_date").values_list("ocid", "data__data", "package_data__data")
+
     # The rows are ordered by OCID, so merge each OCID's releases as its rows stream in, to hold only one OCID's
     # releases in memory at a time. Some OCIDs have thousands of releases (#460).
     merged_batch = []
-    seen_ocids = set()
     for ocid, group in itertools.groupby(rows.iterator(), key=itemgetter(0)):
         seen_ocids.add(ocid)
         releases = []
@@ -73,15 +123,7 @@ def compile_release_batch(collection, ocids):
         if merged := compile_releases_by_ocdskit(collection, ocid, releases, extensions):
             merged_batch.append((ocid, merged))
 
-    # OCIDs with no releases do not appear in the query results.
-    for ocid in ocids:
-        if ocid not in seen_ocids:
-            create_note(collection, CollectionNote.Level.ERROR, f"OCID {ocid} has 0 releases.")
-
-    if merged_batch:
-        save_compiled_releases(collection, merged_batch)
-
-    return [ocid for ocid, _ in merged_batch]
+    return merged_batch
 
 
 def save_compiled_releases(collection, merged_batch):
@@ -94,11 +136,7 @@ def save_compiled_releases(collection, merged_batch):
     CollectionFile.objects.bulk_create(collection_files)
 
     # Like process.management.commands.file_worker._store_data()
-    if settings.DEDUPLICATE_DATA:
-        data_objects = [get_or_create(Data, merged) for _, merged in merged_batch]
-    else:
-        data_objects = [Data(hash_md5="", data=merged) for _, merged in merged_batch]
-        Data.objects.bulk_create(data_objects)
+    data_objects = bulk_get_or_create(Data, [merged for _, merged in merged_batch])
 
     CompiledRelease.objects.bulk_create(
         [
@@ -112,6 +150,7 @@ def save_compiled_releases(collection, merged_batch):
             for (ocid, merged), collection_file, data in zip(merged_batch, collection_files, data_objects, strict=True)
         ]
     )
+    add_counts([(collection.pk, CompiledRelease, len(merged_batch))])
 
 
 def save_compiled_release(merged, collection, ocid):
@@ -128,6 +167,7 @@ def save_compiled_release(merged, collection, ocid):
         release_date=merged.get("date") or "",
     )
     release.save()
+    add_counts([(collection.pk, CompiledRelease, 1)])
 
     return release
 
@@ -2,13 +2,18 @@ import argparse
 import copy
 import logging
 import os
+from collections import Counter
+from contextlib import closing
+from itertools import islice
 
+from django.conf import settings
+from django.db import transaction
 from django.utils.translation import gettext as t
 
 from process.exceptions import InvalidFormError
 from process.forms import CollectionFileForm, CollectionForm, CollectionNote, CollectionNoteForm
 from process.models import Collection, CollectionFile, ProcessingStep
-from process.util import create_step
+from process.util import Prefetcher, create_step
 
 logger = logging.getLogger(__name__)
 
@@ -39,6 +44,64 @@ def create_collection_file(collection, filename=None, url=None) -> CollectionFil
     raise InvalidFormError(form)
 
 
+def bulk_create_collection_files(collection, filenames):
+    """
+    Create files for a collection and steps for these files, in batches of ``BULK_CREATE_BATCH_SIZE``.
+
+    Each batch is created in a transaction, and is yielded after the transaction commits, so that a message published
+    for a yielded file always refers to a committed row.
+
+    Unlike :func:`create_collection_file`, files aren't validated one at a time. Instead, one query per batch checks
+    whether the collection already contains any of the files.
+
+    The filenames are iterated in one background thread, up to two batches ahead, so that walking directories and
+    splitting files overlaps with the database queries and the caller's work.
+
+    :param Collection collection: collection
+    :param filenames: an iterable of paths to file data
+    :returns: a generator of lists of created collection files
+    :raises InvalidFormError: if the collection already contains a file, or if a filename is repeated
+    """
+
+    def batches():
+        iterator = iter(filenames)
+        while batch := list(islice(iterator, settings.BULK_CREATE_BATCH_SIZE)):
+            yield batch
+
+    with closing(iter(Prefetcher(batches(), 2))) as prefetched:
+        for batch in prefetched:
+            with transaction.atomic():
+                existing = CollectionFile.objects.filter(collection=collection, filename__in=batch)
+                if filename := existing.values_list("filename", flat=True).first():
+                    raise _already_contains_file_error(collection, filename)
+                if repeated := [filename for filename, count in Counter(batch).items() if count > 1]:
+                    raise _already_contains_file_error(collection, repeated[0])
+
+                collection_files = CollectionFile.objects.bulk_create(
+                    CollectionFile(collection=collection, filename=filename) for filename in batch
+                )
+                ProcessingStep.objects.bulk_create(
+                    ProcessingStep(
+                        name=ProcessingStep.Name.LOAD, collection_id=collection.pk, collection_file=collection_file
+                    )
+                    for collection_file in collection_files
+                )
+
+            yield collection_files
+
+
+def _already_contains_file_error(collection, filename):
+    # Return the same error as create_collection_file().
+    form = CollectionFileForm({"collection": collection, "filename": filename})
+    # If the filename is repeated within a batch, the file isn't yet created, so the form is valid.
+    if form.is_valid():
+        form.add_error(
+            None,
+            CollectionFile(collection=collection).unique_error_message(CollectionFile, ("collection", "filename")),
+        )
+    return InvalidFormError(form)
+
+
 def create_collections(
     # Identification
     source_id,
@@ -53,6 +116,8 @@ def create_collections(
     scrapyd_job="",
     note="",
     force=False,
+    incremental_from=None,
+    priority=0,
 ) -> tuple[Collection, Collection, Collection]:
     """
     Create the root collection, derived collections and notes.
@@ -66,6 +131,9 @@ def create_collections(
     :param str scrapyd_job: Scrapyd job ID
     :param str note: text description
     :param boolean force: skip validation of the source_id against the Scrapyd project
+    :param int incremental_from: the ID of a collection of the same source, relative to which to store only the data of
+        new or changed releases and records
+    :param int priority: the priority of the collections' messages, if ``RABBIT_MAX_PRIORITY`` is set
     :returns: the root collection, upgraded collection and compiled_collection
     """
     data = {
@@ -74,6 +142,8 @@ def create_collections(
         "sample": sample,
         "scrapyd_job": scrapyd_job,
         "force": force,
+        "compile": compile,
+        "priority": priority,
     }
 
     steps = []
@@ -84,14 +154,23 @@ def create_collections(
     elif compile:
         steps.append("compile")
 
-    collection = _create_collection(data, note, steps=steps)
+    collection = _create_collection(data, note, steps=steps, incremental_from=incremental_from)
 
     upgraded_collection = None
     if upgrade:
         # main -> upgrade -> compile / main -> upgrade
         upgrade_steps = ["compile"] if compile else []
+        # If the base collection wasn't upgraded, all upgraded releases and records are stored.
+        upgraded_incremental_from = None
+        if incremental_from and (base_upgraded_collection := collection.incremental_from.get_upgraded_collection()):
+            upgraded_incremental_from = base_upgraded_collection.pk
         upgraded_collection = _create_collection(
-            data, note, steps=upgrade_steps, parent=collection, transform_type=Collection.Transform.UPGRADE_10_11
+            data,
+            note,
+            steps=upgrade_steps,
+            parent=collection,
+            transform_type=Collection.Transform.UPGRADE_10_11,
+            incremental_from=upgraded_incremental_from,
         )
 
     compiled_collection = None
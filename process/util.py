@@ -1,60 +1,509 @@
+import atexit
+import bz2
+import codecs
+import errno
+import functools
+import gzip
 import hashlib
 import io
+import itertools
 import logging
+import lzma
 import os
-from contextlib import contextmanager
+import queue
+import random
+import re
+import tarfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager, suppress
 from textwrap import fill
 
 import ijson
+import orjson
+import pika
 import simplejson as json
+import zstandard
 from django.conf import settings
-from django.db import IntegrityError, connections, transaction
+from django.db import IntegrityError, connections, router, transaction
+from pika.exceptions import AMQPConnectionError, AMQPError, ChannelClosed, ChannelWrongStateError
+from psycopg.errors import ForeignKeyViolation
+from psycopg.pq import TransactionStatus
 from yapw.clients import AsyncConsumer, Blocking
 from yapw.decorators import decorate
-from yapw.methods import add_callback_threadsafe, nack
+from yapw.methods import add_callback_threadsafe, basic_publish_kwargs, nack
+from yapw.methods import publish as yapw_publish
 
-from process.exceptions import AlreadyExists, InvalidFormError
-from process.models import Collection, CollectionFile, CollectionNote, ProcessingStep, Record
+from process.exceptions import AlreadyExists, DecompressionError, InvalidFormError
+from process.models import (
+    Collection,
+    CollectionCount,
+    CollectionFile,
+    CollectionNote,
+    CompiledRelease,
+    JSONField,
+    ProcessingStep,
+    Record,
+    Release,
+    json_default,
+)
 
 logger = logging.getLogger(__name__)
 
 YAPW_KWARGS = {"url": settings.RABBIT_URL, "exchange": settings.RABBIT_EXCHANGE_NAME, "prefetch_count": 20}
 EXTENSION_URL = "https://raw.githubusercontent.com/open-contracting-extensions/ocds_{}_extension/master/extension.json"
 
+# A member of an archive is addressed as "{archive}{ARCHIVE_SEPARATOR}{member}", like "data.zip!2024/01.json".
+ARCHIVE_SEPARATOR = "!"
+DECOMPRESSORS = {".bz2": bz2.open, ".gz": gzip.open, ".xz": lzma.open, ".zst": zstandard.open}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tgz", *(f".tar{extension}" for extension in DECOMPRESSORS))
+# A chunk of a file is addressed as "{path}[{start}:{end}]", like "data.json[0:1048576]". See split_file().
+CHUNK_SUFFIX = re.compile(r"\[(\d+):(\d+)\]\Z")
+# The number of bytes to read from a file at a time, while splitting it.
+BUFFER_SIZE = 1024 * 1024
+JSON_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+JSON_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]')
+JSON_SEPARATOR = re.compile(rb"[\s,]*")
+NOT_BRACKETS = bytes(set(range(256)) - set(b"[]{}"))
+BRACKET_STEPS = [1 if char in b"[{" else -1 if char in b"]}" else 0 for char in range(256)]
+# The CollectionCount fields that count the rows of each model. The Collection fields are named "cached_*_count".
+COUNT_FIELDS = {
+    Release: "releases",
+    Record: "records",
+    CompiledRelease: "compiled_releases",
+}
+# The number of collection_count rows per collection, over which concurrent workers spread their updates.
+COUNT_SLOTS = 16
+# The errors raised while reading a corrupt compressed file or archive.
+DECOMPRESSION_ERRORS = (
+    DecompressionError,
+    EOFError,
+    gzip.BadGzipFile,
+    lzma.LZMAError,
+    tarfile.TarError,
+    zipfile.BadZipFile,
+    zlib.error,
+    zstandard.ZstdError,
+)
+
 
 def wrap(string):
     """Format a long string as a help message, and return it."""
     return "\n".join(fill(paragraph, width=78, replace_whitespace=False) for paragraph in string.split("\n"))
 
 
-def walk(paths):
+def walk(paths, *, expand=True):
+    """
+    Yield the path of each file in the paths, or the filename of each member, if the file is an archive.
+
+    :param expand: whether to yield the members of archives, instead of the paths to archives
+    """
     for path in paths:
         if os.path.isfile(path):
-            yield path
+            yield from expand_archive(path) if expand else (path,)
         else:
             for root, _, files in os.walk(path):
                 for name in files:
                     if not name.startswith("."):
-                        yield os.path.join(root, name)
+                        yield from expand_archive(os.path.join(root, name)) if expand else (os.path.join(root, name),)
+
+
+def expand_archive(path):
+    """If the path is to an archive, yield the filename of each member that is a file. Otherwise, yield the path."""
+    if not path.lower().endswith(ARCHIVE_EXTENSIONS) or not os.path.isfile(path):
+        yield path
+        return
+
+    with _open_archive(path) as archive:
+        if isinstance(archive, zipfile.ZipFile):
+            names = [info.filename for info in archive.infolist() if not info.is_dir()]
+        else:
+            names = [info.name for info in archive if info.isfile()]
+
+    for name in names:
+        if not os.path.basename(name).startswith("."):
+            yield f"{path}{ARCHIVE_SEPARATOR}{name}"
+
+
+def split_archive_member(filename):
+    """Return the path to the archive and the name of the member, or the filename and ``None``, if not a member."""
+    index = -1
+    while (index := filename.find(ARCHIVE_SEPARATOR, index + 1)) != -1:
+        if filename[:index].lower().endswith(ARCHIVE_EXTENSIONS):
+            return filename[:index], filename[index + 1 :]
+    return filename, None
+
+
+def split_file(path):
+    """
+    Yield the filename of each chunk of the file, if larger than the ``FILE_CHUNK_SIZE`` setting, or else the path.
+
+    Each chunk is a sequence of whole top-level JSON values, or of whole items of a top-level JSON array. Compressed
+    files and members of archives aren't split.
+    """
+    if (
+        not settings.FILE_CHUNK_SIZE
+        or split_archive_member(path)[1] is not None
+        or os.path.splitext(path)[1].lower() in DECOMPRESSORS
+        or not os.path.isfile(path)
+        or os.path.getsize(path) <= settings.FILE_CHUNK_SIZE
+    ):
+        yield path
+        return
+
+    with open(path, "rb") as f:
+        chunks = _find_chunks(f, settings.FILE_CHUNK_SIZE)
+
+    if len(chunks) == 1:
+        yield path
+    else:
+        for start, end in chunks:
+            yield f"{path}[{start}:{end}]"
+
+
+def split_chunk(filename):
+    """Return the path to the file and the byte range of the chunk, or the filename and ``None``, if not a chunk."""
+    if (match := CHUNK_SUFFIX.search(filename)) and not os.path.isfile(filename):
+        return filename[: match.start()], (int(match.group(1)), int(match.group(2)))
+    return filename, None
+
+
+def _find_chunks(f, chunk_size):
+    # The file is read buffer by buffer. Each buffer starts outside a string. Strings are removed and brackets are
+    # counted, in C. If the chunk is large enough and a value can end in the buffer, tokens are read one by one, to
+    # find where the value ends.
+    size = os.fstat(f.fileno()).st_size
+    chunks = []
+    depth = 0
+    level = None  # the depth at which values end, 1 if in a top-level array
+    start = 0  # the start of the current chunk
+    end = None  # the end of the last value, if it ends the current chunk
+    offset = 0  # the position of the buffer in the file
+    carry = b""
+
+    while data := f.read(BUFFER_SIZE):
+        buffer = carry + data
+        if level is None and (stripped := buffer.lstrip()):
+            level = 1 if stripped.startswith(b"[") else 0
+
+        residue = JSON_STRING.sub(b"", buffer)
+        # Any remaining quotation mark starts a string that ends in a later buffer.
+        if (index := residue.find(b'"')) == -1:
+            limit = len(buffer)
+        else:
+            limit = len(buffer) - len(residue) + index
+            residue = residue[:index]
+
+        if end is None and (
+            offset + limit - start < chunk_size
+            or level is None
+            # If the depth stays above the level, no value ends in this buffer.
+            or min(
+                itertools.accumulate(
+                    map(BRACKET_STEPS.__getitem__, residue.translate(None, NOT_BRACKETS)), initial=depth
+                )
+            )
+            > level
+        ):
+            depth += residue.count(b"{") + residue.count(b"[") - residue.count(b"}") - residue.count(b"]")
+        else:
+            position = 0
+            while True:
+                if end is not None:
+                    position = JSON_SEPARATOR.match(buffer, position, limit).end()
+                    if position == len(buffer):
+                        break
+                    # The end of the top-level array isn't a value.
+                    if buffer[position : position + 1] != b"]":
+                        chunks.append((start, end))
+                        start = offset + position
+                    end = None
+
+                for match in JSON_TOKEN.finditer(buffer, position, limit):
+                    char = buffer[match.start()]
+                    if char in b"[{":
+                        depth += 1
+                    elif char in b"]}":
+                        depth -= 1
+                        if depth == level and offset + match.end() - start >= chunk_size:
+                            end = offset + match.end()
+                            position = match.end()
+                            break
+                else:
+                    break
+
+        carry = buffer[limit:]
+        offset += limit
+
+    chunks.append((start, size))
+    return chunks
+
+
+@contextmanager
+def open_file(filename):
+    """
+    Open a file for reading in binary mode. Decompress it, extract it from an archive or read a chunk of it, as needed.
+
+    The members of an uncompressed tar archive are indexed once per process, and then read at their offsets. A
+    compressed tar archive is read from the start, to find the member, so reading all its members decompresses it
+    once per member. To avoid this cost with many members, decompress it to a ``.tar`` file first.
+
+    :param str filename: a path to a file, the filename of a member of an archive (see :func:`expand_archive`), or the
+        filename of a chunk of a file (see :func:`split_file`)
+    :raises FileNotFoundError: if the file, archive or member doesn't exist
+    """
+    path, byte_range = split_chunk(filename)
+    if byte_range:
+        with open(path, "rb") as f:
+            yield ChunkReader(f, *byte_range)
+        return
+
+    path, member = split_archive_member(filename)
+
+    with ExitStack() as stack:
+        if member is None:
+            f = stack.enter_context(open(path, "rb"))
+            name = path
+        else:
+            archive = stack.enter_context(_open_archive(path))
+            f = _open_member(archive, path, member)
+            if f is None:
+                raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), filename)
+            stack.callback(f.close)
+            name = member
+
+        if decompressor := DECOMPRESSORS.get(os.path.splitext(name)[1].lower()):
+            f = stack.enter_context(decompressor(f, "rb"))
+
+        if member is None and decompressor is None:
+            yield f
+        else:
+            yield DecompressedReader(f)
+
+
+class DecompressedReader:
+    """
+    Read a compressed file or a member of an archive, and raise DecompressionError if its data is corrupt.
+
+    bz2 raises OSError, gzip raises BadGzipFile (an OSError), and deflate raises zlib.error.
+    """
+
+    def __init__(self, f):
+        self.file = f
+
+    def read(self, size=-1):
+        try:
+            return self.file.read(size)
+        except (OSError, zlib.error) as e:
+            raise DecompressionError(e) from e
+
+
+class ChunkReader:
+    """
+    Read a chunk of a file as JSON text.
+
+    If the file is a JSON array, a chunk (other than the first and last) is a sequence of items without enclosing
+    brackets, which are added.
+    """
+
+    def __init__(self, f, start, end):
+        self.file = f
+        self.prefix = self.suffix = b""
+        if self._is_array():
+            if start:
+                self.prefix = b"["
+            if end < os.fstat(f.fileno()).st_size:
+                self.suffix = b"]"
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def _is_array(self):
+        self.file.seek(0)
+        while data := self.file.read(BUFFER_SIZE):
+            if stripped := data.lstrip():
+                return stripped.startswith(b"[")
+        return False
+
+    def read(self, size=-1):
+        if not size:
+            return b""
+        if self.prefix:
+            data, self.prefix = self.prefix, b""
+            return data
+        if self.remaining:
+            data = self.file.read(self.remaining if size < 0 else min(size, self.remaining))
+            self.remaining -= len(data)
+            return data
+        data, self.suffix = self.suffix, b""
+        return data
+
+
+@contextmanager
+def _open_archive(path):
+    with ExitStack() as stack:
+        if path.lower().endswith(".zip"):
+            yield stack.enter_context(zipfile.ZipFile(path))
+        elif path.lower().endswith(".tar.zst"):
+            # tarfile doesn't support Zstandard.
+            f = stack.enter_context(zstandard.open(path, "rb"))
+            yield stack.enter_context(tarfile.open(fileobj=f, mode="r|"))
+        elif path.lower().endswith(".tar"):
+            # Open for random access, so that members are read at their offsets.
+            yield stack.enter_context(tarfile.open(path, mode="r:"))
+        else:
+            # Read as a stream, so that a compressed archive is decompressed once.
+            yield stack.enter_context(tarfile.open(path, mode="r|*"))
+
+
+def _open_member(archive, path, member):
+    if isinstance(archive, zipfile.ZipFile):
+        try:
+            return archive.open(member)
+        except KeyError:
+            return None
+    if path.lower().endswith(".tar"):
+        info = _get_tar_members(path, os.stat(path).st_mtime_ns).get(member)
+        return None if info is None else archive.extractfile(info)
+    for info in archive:
+        if info.name == member and info.isfile():
+            return archive.extractfile(info)
+    return None
+
+
+@functools.lru_cache(maxsize=16)
+def _get_tar_members(path, mtime_ns):  # noqa: ARG001 # cache key
+    # Reading the headers of an uncompressed tar archive seeks past the members' data.
+    with tarfile.open(path, mode="r:") as archive:
+        return {info.name: info for info in archive if info.isfile()}
+
+
+class Publisher:
+    """
+    A RabbitMQ publisher that keeps its connection open across uses, and reconnects if the connection was lost.
+
+    The channel is transactional, so that publishing returns once RabbitMQ has accepted the messages. Unlike publisher
+    confirms, for which Pika's blocking channel waits after each message, a transaction waits once per batch.
+
+    Pika's connections are not thread-safe. Use :func:`get_publisher`, which lends each publisher to one thread at a
+    time.
+    """
+
+    def __init__(self):
+        self.client = None
+
+    def _connect(self):
+        if self.client is None:
+            self.client = Blocking(**YAPW_KWARGS)
+            self.client.channel.tx_select()
+        else:
+            # The connection might have been idle for longer than the heartbeat timeout. Process any heartbeats and
+            # close frames, which raises an error if the connection was lost.
+            self.client.connection.process_data_events(time_limit=0)
+        return self.client
+
+    def publish(self, message, routing_key, *, priority=0):
+        """Publish the message with the routing key. See :meth:`publish_many`."""
+        self.publish_many([(message, routing_key)], priority=priority)
+
+    def publish_many(self, messages, *, priority=0):
+        """
+        Publish the messages, in order, over one connection, and commit them in one transaction.
+
+        If the connection was lost, reconnect once and publish the messages again, since RabbitMQ discards the messages
+        of an uncommitted transaction. If RabbitMQ committed the transaction but the connection was lost before the
+        reply, the messages are published twice, which the workers tolerate, as for any duplicate delivery.
+
+        :param messages: an iterable of ``(message, routing_key)`` pairs
+        :param priority: the priority of the messages (see :func:`publish`)
+        """
+        messages = list(messages)
+        for attempt in range(2):
+            try:
+                client = self._connect()
+                for message, routing_key in messages:
+                    keywords = basic_publish_kwargs(client, message, routing_key)
+                    keywords["properties"] = _properties(client, priority)
+                    client.channel.basic_publish(**keywords)
+                client.channel.tx_commit()
+            except (AMQPConnectionError, ChannelClosed, ChannelWrongStateError) as e:
+                self.close()
+                if attempt:
+                    raise
+                logger.warning("Reconnecting to RabbitMQ after %r", e)
+            else:
+                return
+
+    def close(self):
+        """Close the connection, if open."""
+        if self.client is not None:
+            client = self.client
+            self.client = None
+            with suppress(AMQPError):
+                if client.connection.is_open:
+                    client.close()
+
+
+# Idle publishers. The most recently used publisher is reused first, because its connection is least likely to have
+# timed out. The number of publishers is the peak number of threads that published concurrently.
+_publishers = queue.LifoQueue()
 
 
 @contextmanager
 def get_publisher():
-    client = Blocking(**YAPW_KWARGS)
+    """Lend an idle :class:`Publisher` to the current thread, or create one, and return it to the pool after use."""
     try:
-        yield client
+        publisher = _publishers.get_nowait()
+    except queue.Empty:
+        publisher = Publisher()
+    try:
+        yield publisher
     finally:
-        client.close()
+        _publishers.put_nowait(publisher)
+
+
+@atexit.register
+def _close_publishers():
+    while True:
+        try:
+            _publishers.get_nowait().close()
+        except queue.Empty:
+            break
 
 
 def consume(*args, **kwargs):
+    if settings.RABBIT_MAX_PRIORITY:
+        kwargs["arguments"] = {**(kwargs.get("arguments") or {}), "x-max-priority": settings.RABBIT_MAX_PRIORITY}
     client = AsyncConsumer(*args, **kwargs, **YAPW_KWARGS)
     client.start()
 
 
+def publish(client_state, channel, message, routing_key, priority=None):
+    """
+    Publish the message with the routing key and priority, from a worker's callback.
+
+    Messages about a collection are published with the collection's priority. RabbitMQ ignores the priority, unless
+    the queue was declared with ``RABBIT_MAX_PRIORITY``.
+    """
+    yapw_publish(client_state, channel, message, routing_key, properties=_properties(client_state, priority))
+
+
+def _properties(state, priority):
+    # Like yapw.methods.basic_publish_kwargs(), with the priority.
+    return pika.BasicProperties(
+        content_type=state.content_type, delivery_mode=state.delivery_mode, priority=priority or None
+    )
+
+
 def decorator(decode, callback, state, channel, method, properties, body):
     """
-    Close the database connections opened by the callback, before returning.
+    Close the database connections opened by the callback, before returning, unless they can be reused.
+
+    Like Django's request handling, a connection is reused if it is younger than ``DATABASE_CONN_MAX_AGE``, isn't in a
+    transaction, and is usable, if an error occurred. Connections are per-thread, so each of the consumer's threads
+    reuses its own connection.
 
     If the callback raises an exception, shut down the client in the main thread, without acknowledgment. For some
     exceptions, assume that the same message was delivered twice, log an error, and nack the message.
@@ -71,7 +520,7 @@ def decorator(decode, callback, state, channel, method, properties, body):
         #
         # Collection.DoesNotExist should only occur in the wiper worker due to a duplicate message. It can also occur
         # in the finisher worker if the worker was stopped, and the wiper ran before the finisher.
-        if isinstance(exception, AlreadyExists | InvalidFormError | IntegrityError | Collection.DoesNotExist):
+        if is_duplicate_message_error(exception):
             logger.exception("%s maybe caused by duplicate message %r, skipping", type(exception).__name__, body)
             nack(state, channel, method.delivery_tag, requeue=False)
         # This error should never occur under normal operations. However, such messages interrupt processing, so they
@@ -83,31 +532,325 @@ def decorator(decode, callback, state, channel, method, properties, body):
             logger.exception("Unhandled exception when consuming %r, shutting down gracefully", body)
             add_callback_threadsafe(state.connection, state.interrupt)
 
-    def finalback():
-        for conn in connections.all():
+    decorate(decode, callback, state, channel, method, properties, body, errback, close_connections)
+
+
+def is_duplicate_message_error(exception):
+    """
+    Return whether the exception is maybe caused by a duplicate message. See :func:`decorator`.
+
+    A foreign key violation isn't, since a message never references a row that it deletes. It can be caused by a stale
+    :class:`HashIdCache`, if the deleteorphan command deleted a cached row.
+    """
+    return isinstance(
+        exception, AlreadyExists | InvalidFormError | IntegrityError | Collection.DoesNotExist
+    ) and not isinstance(exception.__cause__, ForeignKeyViolation)
+
+
+def close_connections():
+    """Close the current thread's database connections, unless they can be reused. See :func:`decorator`."""
+    for conn in connections.all(initialized_only=True):
+        # Don't reuse a connection in a transaction (like an aborted transaction), even if Django isn't aware of it.
+        if conn.connection is not None and conn.connection.info.transaction_status != TransactionStatus.IDLE:
             conn.close()
+        else:
+            conn.close_if_unusable_or_obsolete()
 
-    decorate(decode, callback, state, channel, method, properties, body, errback, finalback)
 
+def _escape_non_ascii(error):
+    # Like simplejson's ensure_ascii, with surrogate pairs for characters outside the Basic Multilingual Plane.
+    units = error.object[error.start : error.end].encode("utf-16-be")
+    return "".join(f"\\u{units[i : i + 2].hex()}" for i in range(0, len(units), 2)), error.end
+
+
+codecs.register_error("process.escape_non_ascii", _escape_non_ascii)
 
-def get_or_create(model, data):
-    """Get or create a PackageData or Data instance."""
-    if not settings.DEDUPLICATE_DATA:
-        return model.objects.create(hash_md5="", data=data)
 
-    hash_md5 = hashlib.md5(  # noqa: S324 # non-cryptographic
-        json.dumps(data, separators=(",", ":"), sort_keys=True, use_decimal=True).encode("utf-8")
-    ).hexdigest()
+def canonical_json(data, *, floats=True):
+    """
+    Serialize the data with sorted keys, no whitespace and only ASCII characters, and return the bytes.
+
+    The output is the same as ``simplejson.dumps(data, separators=(",", ":"), sort_keys=True, use_decimal=True)``,
+    which is what existing hashes were computed from.
+
+    :param floats: whether the data might contain float values. If False, like for data parsed by ijson (which
+        constructs Decimal values instead), the data is serialized with orjson, which is faster but formats floats
+        differently.
+    """
+    if not floats:
+        try:
+            serialized = orjson.dumps(data, default=json_default, option=orjson.OPT_SORT_KEYS)
+        # For example, integers beyond 64 bits, or strings with lone surrogates.
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            if not serialized.isascii():
+                serialized = serialized.decode().encode("ascii", "process.escape_non_ascii")
+            # orjson doesn't escape DEL, unlike simplejson.
+            return serialized.replace(b"\x7f", b"\\u007f")
+
+    return json.dumps(data, separators=(",", ":"), sort_keys=True, use_decimal=True).encode("utf-8")
+
 
+def serialize_json(data):
+    """
+    Serialize the data, to store but not to hash, and return the bytes.
+
+    Unlike :func:`canonical_json`, keys are not sorted and non-ASCII characters are not escaped, which is much faster.
+    PostgreSQL normalizes ``jsonb`` values, so the stored value is the same.
+
+    The data must not contain float values, like data parsed by ijson (see :func:`canonical_json`).
+    """
     try:
-        # Another transaction is needed here, otherwise a parent transaction catches the integrity error.
-        with transaction.atomic():
-            obj, _created = model.objects.get_or_create(hash_md5=hash_md5, defaults={"data": data})
-    # If another transaction in another thread COMMITs the same data after the SELECT, but before the INSERT.
-    except IntegrityError:
-        obj = model.objects.get(hash_md5=hash_md5)
+        return orjson.dumps(data, default=json_default)
+    # For example, integers beyond 64 bits, or strings with lone surrogates.
+    except orjson.JSONEncodeError:
+        return canonical_json(data)
+
+
+def get_hash(data, *, floats=True):
+    """Return the MD5 hash of the data, serialized with sorted keys. See :func:`canonical_json`."""
+    return hashlib.md5(canonical_json(data, floats=floats)).hexdigest()  # noqa: S324 # non-cryptographic
+
+
+def get_file_hash(filename):
+    """Return the MD5 hash of the bytes of a file, after any decompression (see :func:`open_file`)."""
+    md5 = hashlib.md5()  # noqa: S324 # non-cryptographic
+    with open_file(filename) as f:
+        while chunk := f.read(BUFFER_SIZE):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def get_or_create(model, data, *, floats=True):
+    """Get or create a PackageData or Data instance. See :func:`bulk_get_or_create`."""
+    return bulk_get_or_create(model, [data], floats=floats)[0]
+
+
+def bulk_get_or_create(model, data_list, *, floats=True):
+    """
+    Get or create PackageData or Data instances, in bulk. See :func:`bulk_get_or_create_ids`.
+
+    :param model: the PackageData or Data model
+    :param data_list: a list of data
+    :param floats: whether the data might contain float values (see :func:`canonical_json`)
+    :returns: a list of PackageData or Data instances, in the same order as ``data_list``
+    """
+    serialized = [canonical_json(data, floats=floats) for data in data_list]
+    ids = bulk_get_or_create_ids(model, serialized)
+    if settings.DEDUPLICATE_DATA:
+        hashes = [hashlib.md5(value).hexdigest() for value in serialized]  # noqa: S324 # non-cryptographic
+    else:
+        hashes = [""] * len(serialized)
+    return [
+        model(pk=pk, hash_md5=hash_md5, data=data) for pk, hash_md5, data in zip(ids, hashes, data_list, strict=True)
+    ]
+
+
+def bulk_get_or_create_ids(model, serialized):
+    """
+    Get or create PackageData or Data rows for serialized data, in bulk.
+
+    With deduplication, the hashes of the batch are resolved with one ``INSERT ... ON CONFLICT DO NOTHING RETURNING``
+    statement and one ``SELECT`` statement for the hashes that already exist. Rows are inserted in hash order, so that
+    concurrent transactions acquire locks in the same order, to avoid deadlocks. The serialized data is used for both
+    the hash and the value.
 
-    return obj
+    :param model: the PackageData or Data model
+    :param serialized: a list of data, serialized by :func:`canonical_json` (or, without deduplication, by
+        :func:`serialize_json`)
+    :returns: the ids of the rows, in the same order as ``serialized``
+    """
+    if not serialized:
+        return []
+
+    connection = connections[router.db_for_write(model)]
+
+    if not settings.DEDUPLICATE_DATA:
+        placeholders = ", ".join(["('', %s::jsonb)"] * len(serialized))
+        with connection.cursor() as cursor:
+            # Like bulk_create(), this relies on PostgreSQL returning rows in the order of the VALUES.
+            cursor.execute(
+                f"INSERT INTO {model._meta.db_table} (hash_md5, data) "  # noqa: S608 # trusted input
+                f"VALUES {placeholders} "
+                "RETURNING id",
+                [value.decode() for value in serialized],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    hashes = [hashlib.md5(value).hexdigest() for value in serialized]  # noqa: S324 # non-cryptographic
+    # Identical data within the batch is inserted once.
+    unique = dict(zip(hashes, serialized, strict=True))
+
+    ids = {}
+    cache = get_hash_id_cache(model, settings.DATA_CACHE_SIZE) if settings.DATA_CACHE_SIZE else None
+    if cache:
+        ids.update(cache.get_many(unique))
+        # Hashes that were seen, but evicted from the cache, likely exist, so SELECT them instead of INSERT them.
+        if seen := [hash_md5 for hash_md5 in unique if hash_md5 not in ids and hash_md5 in cache.bloom_filter]:
+            ids.update(model.objects.filter(hash_md5__in=seen).values_list("hash_md5", "id"))
+
+    if new := sorted(hash_md5 for hash_md5 in unique if hash_md5 not in ids):
+        values = []
+        for hash_md5 in new:
+            values.extend([hash_md5, unique[hash_md5].decode("ascii")])
+
+        with connection.cursor() as cursor:
+            # The conflict target must match the partial unique constraint on hash_md5.
+            cursor.execute(
+                f"INSERT INTO {model._meta.db_table} (hash_md5, data) "  # noqa: S608 # trusted input
+                f"VALUES {', '.join(['(%s, %s::jsonb)'] * len(new))} "
+                "ON CONFLICT (hash_md5) WHERE NOT hash_md5 = '' DO NOTHING "
+                "RETURNING hash_md5, id",
+                values,
+            )
+            ids.update(cursor.fetchall())
+
+        # If another transaction COMMITs the same data first, the INSERT waits for it, then skips the conflicting row.
+        if missing := [hash_md5 for hash_md5 in new if hash_md5 not in ids]:
+            ids.update(model.objects.filter(hash_md5__in=missing).values_list("hash_md5", "id"))
+
+    if cache:
+        # Cache the ids once committed, since the rows of a rolled back transaction don't exist.
+        transaction.on_commit(functools.partial(cache.add_many, ids), using=connection.alias)
+
+    return [ids[hash_md5] for hash_md5 in hashes]
+
+
+class BloomFilter:
+    """
+    A set of MD5 hashes that can have false positives, but not false negatives, in constant memory.
+
+    The false positive rate is about 1% at capacity. Once at capacity, the filter is cleared.
+    """
+
+    # The number of bits per hash and the number of bit positions per hash, for a 1% false positive rate.
+    BITS_PER_ITEM = 10
+    POSITIONS = 7
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = capacity * self.BITS_PER_ITEM
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hash_md5):
+        # An MD5 hash is uniformly distributed, so its halves serve as two independent hash functions.
+        value = int(hash_md5, 16)
+        low, high = value & 0xFFFFFFFFFFFFFFFF, value >> 64
+        return ((low + i * high) % self.size for i in range(self.POSITIONS))
+
+    def add(self, hash_md5):
+        if self.count >= self.capacity:
+            self.bits = bytearray(len(self.bits))
+            self.count = 0
+        for position in self._positions(hash_md5):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, hash_md5):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(hash_md5))
+
+
+class HashIdCache:
+    """
+    A thread-safe cache of the ids of the most recently used hashes, and a Bloom filter of more hashes.
+
+    :param size: the maximum number of ids to cache. The Bloom filter's capacity is 10 times this size.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.ids = OrderedDict()
+        self.bloom_filter = BloomFilter(size * 10)
+        self.lock = threading.Lock()
+
+    def get_many(self, hashes):
+        """Return the cached ids of the hashes, as a dict."""
+        found = {}
+        with self.lock:
+            for hash_md5 in hashes:
+                if (pk := self.ids.get(hash_md5)) is not None:
+                    self.ids.move_to_end(hash_md5)
+                    found[hash_md5] = pk
+        return found
+
+    def add_many(self, ids):
+        """Cache the ids of hashes, from a dict, evicting the least recently used ids."""
+        with self.lock:
+            for hash_md5, pk in ids.items():
+                if hash_md5 not in self.ids:
+                    self.bloom_filter.add(hash_md5)
+                self.ids[hash_md5] = pk
+                self.ids.move_to_end(hash_md5)
+            while len(self.ids) > self.size:
+                self.ids.popitem(last=False)
+
+
+@functools.cache
+def get_hash_id_cache(model, size):  # noqa: ARG001 # cache key
+    """
+    Return the worker's cache of the ids of the hashes of the model's rows. See :class:`HashIdCache`.
+
+    If a cached id is stale, because the deleteorphan command deleted the row, inserting a row that references it
+    raises a foreign key violation. To recover, call ``get_hash_id_cache.cache_clear()``, then retry.
+    """
+    return HashIdCache(size)
+
+
+def reserve_ids(model, count):
+    """Reserve and return ``count`` primary key values from the sequence of the model's table."""
+    connection = connections[router.db_for_write(model)]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [model._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def copy_rows(model, columns, rows):
+    """
+    Stream rows into the model's table with ``COPY``.
+
+    Values are prepared by their fields, like ``bulk_create()``, for example to convert numbers to strings for text
+    columns. The values of JSON columns are serialized JSON text.
+
+    :param model: the model whose table to copy into
+    :param columns: the names of the columns to copy
+    :param rows: an iterable of tuples of values, in the same order as ``columns``
+    """
+    connection = connections[router.db_for_write(model)]
+    fields = [model._meta.get_field(column) for column in columns]
+    prepare = [None if isinstance(field, JSONField) else field.get_db_prep_save for field in fields]
+    statement = f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN"
+    # Unlike execute(), copy() isn't wrapped by Django to convert database errors (like ProgramLimitExceeded).
+    with connection.wrap_database_errors, connection.cursor() as cursor, cursor.copy(statement) as copy:
+        for row in rows:
+            copy.write_row(
+                tuple(
+                    value if method is None else method(value, connection)
+                    for method, value in zip(prepare, row, strict=True)
+                )
+            )
+
+
+def bulk_copy(model, serialized):
+    """
+    Create PackageData or Data rows for serialized data with ``COPY``, without deduplication.
+
+    :param model: the PackageData or Data model
+    :param serialized: a list of data, serialized by :func:`canonical_json` or :func:`serialize_json`
+    :returns: the ids of the created rows, in the same order as ``serialized``
+    """
+    # The ids are reserved up front, so that rows that reference these rows can be copied, too.
+    ids = reserve_ids(model, len(serialized))
+    copy_rows(
+        model,
+        ("id", "hash_md5", "data"),
+        ((pk, "", value.decode()) for pk, value in zip(ids, serialized, strict=True)),
+    )
+    return ids
 
 
 def create_note(collection, code, note, **kwargs):
@@ -116,6 +859,35 @@ def create_note(collection, code, note, **kwargs):
     CollectionNote(collection=collection, code=code, note=note, **kwargs).save()
 
 
+def add_counts(counts):
+    """
+    Add to collections' counts of rows, in the caller's transaction.
+
+    The finisher worker adds the counts to the collection's ``cached_*_count`` fields. Call this last in the
+    transaction, after inserting data, so that the collection_count rows are locked briefly and in a fixed order, to
+    avoid deadlocks. Each call updates a random row (slot) per collection, so that concurrent workers rarely wait.
+
+    :param counts: a list of ``(collection_id, model, count)`` tuples
+    """
+    deltas = {}
+    for collection_id, model, count in counts:
+        if count:
+            fields = deltas.setdefault(collection_id, dict.fromkeys(COUNT_FIELDS.values(), 0))
+            fields[COUNT_FIELDS[model]] += count
+
+    with connections[router.db_for_write(CollectionCount)].cursor() as cursor:
+        for collection_id, fields in sorted(deltas.items()):
+            cursor.execute(
+                "INSERT INTO collection_count (collection_id, slot, releases, records, compiled_releases) "
+                "VALUES (%(collection_id)s, %(slot)s, %(releases)s, %(records)s, %(compiled_releases)s) "
+                "ON CONFLICT (collection_id, slot) DO UPDATE SET "
+                "releases = collection_count.releases + excluded.releases, "
+                "records = collection_count.records + excluded.records, "
+                "compiled_releases = collection_count.compiled_releases + excluded.compiled_releases",
+                {"collection_id": collection_id, "slot": random.randrange(COUNT_SLOTS), **fields},  # noqa: S311
+            )
+
+
 def create_step(name, collection_id, **kwargs):
     ProcessingStep(name=name, collection_id=collection_id, **kwargs).save()
 
@@ -134,8 +906,10 @@ def deleting_step(*args, **kwargs):
         # See the try/except block in the callback() function of the file_worker worker.
         FileNotFoundError,
         ijson.common.IncompleteJSONError,
+        *DECOMPRESSION_ERRORS,
     ) as exception:
-        delete_step(*args, **kwargs, exception=exception)
+        if not isinstance(exception, IntegrityError) or is_duplicate_message_error(exception):
+            delete_step(*args, **kwargs, exception=exception)
         raise
     else:
         delete_step(*args, **kwargs)
@@ -154,21 +928,135 @@ def delete_step(name, finish=None, finish_args=(), exception=None, **kwargs):
 
 
 @contextmanager
-def create_logger_note(collection, name):
+def capture_warnings(name):
+    """Yield a stream, to which the named logger's warnings in this thread are written, until the context exits."""
     stream = io.StringIO()
     handler = logging.StreamHandler(stream)
     handler.setLevel(logging.WARNING)
+    # The logger is shared by the worker's threads.
+    thread = threading.get_ident()
+    handler.addFilter(lambda record: record.thread == thread)
     logger = logging.getLogger(name)
     logger.addHandler(handler)
 
-    yield
+    try:
+        yield stream
+    finally:
+        logger.removeHandler(handler)
 
-    logger.removeHandler(handler)
+
+@contextmanager
+def create_logger_note(collection, name):
+    with capture_warnings(name) as stream:
+        yield
 
     if note := stream.getvalue():
         create_note(collection, CollectionNote.Level.WARNING, note)
 
 
+class Prefetcher:
+    """
+    Iterate over an iterable in a background thread, while the current thread uses the items it already yielded.
+
+    Up to ``size`` items are read ahead, after which the background thread waits. If ``size`` is 0, the iterable is
+    iterated in the current thread. An exception raised by the iterable is re-raised in the current thread.
+
+    The time spent in each stage is recorded, in seconds, to find which stage is the bottleneck:
+
+    produce_time
+        Time spent getting items from the iterable.
+    produce_wait
+        Time the background thread waited for the current thread to take an item.
+    consume_wait
+        Time the current thread waited for the next item.
+    """
+
+    _ITEM, _ERROR, _DONE = range(3)
+
+    def __init__(self, iterable, size):
+        self.iterable = iterable
+        self.size = size
+        self.produce_time = 0.0
+        self.produce_wait = 0.0
+        self.consume_wait = 0.0
+
+    def __iter__(self):
+        if not self.size:
+            yield from self._iterate_synchronously()
+            return
+
+        stop = threading.Event()
+        messages = queue.Queue(self.size)
+        thread = threading.Thread(target=self._produce, args=(messages, stop), daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                start = time.perf_counter()
+                kind, value = messages.get()
+                self.consume_wait += time.perf_counter() - start
+
+                if kind == self._DONE:
+                    break
+                if kind == self._ERROR:
+                    raise value
+                yield value
+        finally:
+            # If the current thread stops early, let the background thread exit.
+            stop.set()
+            thread.join()
+
+    def _iterate_synchronously(self):
+        iterator = iter(self.iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                self.produce_time += elapsed
+                self.consume_wait += elapsed
+            yield item
+
+    def _produce(self, messages, stop):
+        def put(message):
+            start = time.perf_counter()
+            try:
+                while not stop.is_set():
+                    try:
+                        messages.put(message, timeout=0.1)
+                    except queue.Full:
+                        continue
+                    else:
+                        return True
+                return False
+            finally:
+                self.produce_wait += time.perf_counter() - start
+
+        iterator = iter(self.iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    self.produce_time += time.perf_counter() - start
+                if not put((self._ITEM, item)):
+                    return
+        except Exception as e:  # noqa: BLE001 # re-raised in the consuming thread
+            put((self._ERROR, e))
+        else:
+            put((self._DONE, None))
+        finally:
+            # Close any files that a generator opened, in the thread that iterated it.
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+
 def get_extensions(package):
     extensions = set()
 
@@ -55,6 +55,15 @@ class CreateCollectionSerializer(serializers.Serializer):
     # Other
     job = serializers.CharField(help_text="The Scrapyd job ID of the Scrapy crawl", required=False)
     note = serializers.CharField(help_text="A note to add to the collection", required=False)
+    incremental_from = serializers.IntegerField(
+        help_text="The ID of a collection of the same source, relative to which to store only new or changed data",
+        required=False,
+    )
+    priority = serializers.IntegerField(
+        help_text="The priority of the collection's messages, relative to other collections' messages",
+        required=False,
+        min_value=0,
+    )
 
 
 class CloseCollectionSerializer(serializers.Serializer):
@@ -98,6 +107,8 @@ class CollectionViewSet(viewsets.ViewSet):
             # Other
             scrapyd_job=serializer.data.get("job", ""),
             note=serializer.data.get("note", ""),
+            incremental_from=serializer.data.get("incremental_from"),
+            priority=serializer.data.get("priority", 0),
         )
 
         result = {"collection_id": collection.pk}
@@ -137,12 +148,12 @@ class CollectionViewSet(viewsets.ViewSet):
                 stats = serializer.data["stats"]
                 create_note(collection, CollectionNote.Level.INFO, "Spider stats", data=stats)
 
+        collections = [collection, upgraded_collection, collection.get_compiled_collection()]
         with get_publisher() as client:
-            client.publish({"collection_id": collection.pk}, routing_key="collection_closed")
-            if upgraded_collection:
-                client.publish({"collection_id": upgraded_collection.pk}, routing_key="collection_closed")
-            if compiled_collection := collection.get_compiled_collection():
-                client.publish({"collection_id": compiled_collection.pk}, routing_key="collection_closed")
+            client.publish_many(
+                (({"collection_id": c.pk}, "collection_closed") for c in collections if c),
+                priority=collection.priority,
+            )
 
         return Response(status=status.HTTP_202_ACCEPTED)
 
@@ -0,0 +1,98 @@
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.test import TransactionTestCase, override_settings
+from ocdskit.util import Format
+
+from process.management.commands import compiler
+from process.management.commands.file_worker import process_file
+from process.models import Collection, CollectionFile, ProcessingStep, Release
+from tests.fixtures import collection
+
+
+@patch("process.management.commands.compiler.publish")
+@patch("process.management.commands.compiler.ack")
+@override_settings(COMPILE_BATCH_SIZE=30)
+class CompilerTests(TransactionTestCase):
+    def create_collections(self, data_format, filename, **kwargs):
+        source = collection(steps=["compile"], **kwargs)
+        source.data_type = {"format": data_format, "concatenated": False, "array": True}
+        source.save()
+        compiled = collection(parent=source, transform_type=Collection.Transform.COMPILE_RELEASES)
+        compiled.save()
+
+        collection_file = CollectionFile(collection=source, filename=filename)
+        collection_file.save()
+        process_file(collection_file)
+
+        return collection_file, compiled
+
+    def test_release_package(self, ack, publish):
+        collection_file, compiled = self.create_collections(
+            Format.release_package, "tests/fixtures/collection_file.json", store_end_at="2001-01-01 00:00:00"
+        )
+
+        method = Mock(routing_key=f"{settings.RABBIT_EXCHANGE_NAME}_collection_closed")
+        compiler.callback(None, None, method, None, {"collection_id": collection_file.collection_id})
+
+        ranges = [call.args[2]["ocid_range"] for call in publish.call_args_list]
+        steps = ProcessingStep.objects.filter(collection=compiled, name=ProcessingStep.Name.COMPILE)
+        ocids = list(Release.objects.order_by("ocid").values_list("ocid", flat=True).distinct())
+
+        # One step per range, not per OCID.
+        self.assertEqual(
+            ranges,
+            [[None, ocids[29]], [ocids[29], ocids[59]], [ocids[59], ocids[89]], [ocids[89], ocids[99]]],
+        )
+        self.assertEqual(set(steps.values_list("ocid", flat=True)), {upto for _, upto in ranges})
+        self.assertTrue(Collection.objects.get(pk=compiled.pk).compilation_enqueued)
+
+    @override_settings(COMPILE_BATCH_RELEASES=10)
+    def test_release_package_cost(self, ack, publish):
+        collection_file, _ = self.create_collections(
+            Format.release_package, "tests/fixtures/collection_file.json", store_end_at="2001-01-01 00:00:00"
+        )
+        ocids = list(Release.objects.order_by("ocid").values_list("ocid", flat=True).distinct())
+        release = Release.objects.get(ocid=ocids[5])
+        Release.objects.bulk_create(
+            Release(
+                collection_id=release.collection_id,
+                collection_file_id=release.collection_file_id,
+                ocid=release.ocid,
+                data_id=release.data_id,
+                package_data_id=release.package_data_id,
+            )
+            for _ in range(19)
+        )
+
+        method = Mock(routing_key=f"{settings.RABBIT_EXCHANGE_NAME}_collection_closed")
+        compiler.callback(None, None, method, None, {"collection_id": collection_file.collection_id})
+
+        ranges = [call.args[2]["ocid_range"] for call in publish.call_args_list]
+
+        # The OCID with 20 releases is isolated, and other ranges have up to 10 releases.
+        self.assertEqual(
+            ranges[:4],
+            [[None, ocids[4]], [ocids[4], ocids[5]], [ocids[5], ocids[15]], [ocids[15], ocids[25]]],
+        )
+        self.assertEqual(ranges[-1], [ocids[95], ocids[99]])
+
+    def test_record_package(self, ack, publish):
+        collection_file, compiled = self.create_collections(
+            Format.record_package, "tests/fixtures/record_package.json"
+        )
+
+        method = Mock(routing_key=f"{settings.RABBIT_EXCHANGE_NAME}_file_worker")
+        compiler.callback(
+            None,
+            None,
+            method,
+            None,
+            {"collection_id": collection_file.collection_id, "collection_file_id": collection_file.pk},
+        )
+
+        ocids = [call.args[2]["ocid"] for call in publish.call_args_list]
+        steps = ProcessingStep.objects.filter(collection=compiled, name=ProcessingStep.Name.COMPILE)
+
+        self.assertEqual(sorted(ocids), ["ocds-aaa111", "ocds-bbb222"])
+        self.assertEqual(sorted(steps.values_list("ocid", flat=True)), ["ocds-aaa111", "ocds-bbb222"])
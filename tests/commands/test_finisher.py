@@ -0,0 +1,96 @@
+from unittest.mock import Mock, patch
+
+from django.test import TestCase
+
+from process.management.commands import finisher
+from process.models import Collection, CollectionCount
+from tests.fixtures import collection
+
+
+@patch("process.management.commands.finisher.add_callback_threadsafe")
+@patch("process.management.commands.finisher.nack")
+@patch("process.management.commands.finisher.ack")
+class FinisherTests(TestCase):
+    def setUp(self):
+        finisher.requeued.clear()
+        finisher.checking.clear()
+        self.client_state = Mock()
+
+    def consume(self, collection_id, *, redelivered=False, delivery_tag=1):
+        method = Mock(redelivered=redelivered, delivery_tag=delivery_tag)
+        finisher.callback(self.client_state, "channel", method, None, {"collection_id": collection_id})
+
+    def test_requeue_first_message(self, ack, nack, add_callback_threadsafe):
+        self.consume(1, delivery_tag=1)
+        self.consume(1, delivery_tag=2)
+        self.consume(2, delivery_tag=3)
+
+        self.assertEqual([c.args[2] for c in nack.call_args_list], [1, 3])
+        self.assertEqual([c.args[2] for c in ack.call_args_list], [2])
+
+    @patch("process.management.commands.finisher.REQUEUED_MAX_SIZE", 2)
+    def test_requeued_bounded(self, ack, nack, add_callback_threadsafe):
+        for collection_id in (1, 2, 3):
+            self.consume(collection_id)
+
+        self.assertEqual(list(finisher.requeued), [2, 3])
+
+    def test_completed(self, ack, nack, add_callback_threadsafe):
+        source = collection(store_end_at="2001-01-01 00:00:00")
+        source.save()
+
+        self.consume(source.pk, redelivered=True)
+
+        ack.assert_called_once()
+        nack.assert_not_called()
+        add_callback_threadsafe.assert_not_called()
+        self.assertIsNotNone(Collection.objects.get(pk=source.pk).completed_at)
+        self.assertEqual(finisher.checking, set())
+
+    def test_completed_counts(self, ack, nack, add_callback_threadsafe):
+        source = collection(store_end_at="2001-01-01 00:00:00", cached_releases_count=10)
+        source.save()
+        # A collection that started loading before the counts were maintained.
+        Collection.objects.filter(pk=source.pk).update(cached_records_count=None)
+        CollectionCount.objects.bulk_create(
+            [
+                CollectionCount(collection=source, slot=0, releases=3, records=1),
+                CollectionCount(collection=source, slot=1, releases=2),
+            ]
+        )
+
+        self.consume(source.pk, redelivered=True)
+
+        source = Collection.objects.get(pk=source.pk)
+        self.assertEqual(source.cached_releases_count, 15)  # not counted
+        self.assertEqual(source.cached_records_count, 0)  # counted
+        self.assertEqual(source.cached_compiled_releases_count, 0)
+        self.assertFalse(CollectionCount.objects.exists())
+
+    def test_nonexistent(self, ack, nack, add_callback_threadsafe):
+        self.consume(100, redelivered=True)
+
+        ack.assert_called_once()
+        self.assertEqual(finisher.checking, set())
+
+    def test_recheck(self, ack, nack, add_callback_threadsafe):
+        source = collection()  # not closed
+        source.save()
+
+        self.consume(source.pk, redelivered=True, delivery_tag=1)
+        # A redelivered message for the same collection is ack'ed, while the first waits to be checked again.
+        self.consume(source.pk, redelivered=True, delivery_tag=2)
+
+        self.assertEqual([c.args[2] for c in ack.call_args_list], [2])
+        nack.assert_not_called()
+        self.assertEqual(finisher.checking, {source.pk})
+
+        # Run the callback that the IO loop would run, and the function that it would call after the delay.
+        add_callback_threadsafe.assert_called_once()
+        add_callback_threadsafe.call_args.args[1]()
+        delay, requeue = self.client_state.connection.ioloop.call_later.call_args.args
+        self.assertEqual(delay, finisher.RECHECK_DELAY)
+        requeue()
+
+        nack.assert_called_once_with(self.client_state, "channel", 1, requeue=True)
+        self.assertEqual(finisher.checking, set())
@@ -63,3 +63,13 @@ class WiperTests(TransactionTestCase):
         self.assertEqual(CompiledRelease.objects.count(), 0)
         self.assertEqual(Data.objects.count(), 2)
         self.assertEqual(PackageData.objects.count(), 1)
+
+    def test_incremental_from(self):
+        source = self.build_collection()
+        incremental = collection(incremental_from=source)
+        incremental.data_version = "2001-01-02 00:00:00"
+        incremental.save()
+
+        delete_collection(source.id)
+
+        self.assertEqual(list(Collection.objects.values_list("pk", "incremental_from")), [(incremental.pk, None)])
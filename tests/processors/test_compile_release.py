@@ -1,7 +1,10 @@
 from django.test import TransactionTestCase
+from ocdskit.util import Format
 
-from process.models import Collection, CollectionNote, CompiledRelease
-from process.processors.compiler import compile_release_batch
+from process.management.commands.file_worker import process_file
+from process.models import Collection, CollectionFile, CollectionNote, CompiledRelease, Release
+from process.processors.compiler import compile_release_batch, compile_release_range
+from tests.fixtures import collection as create_collection
 
 
 class CompileReleaseBatchTests(TransactionTestCase):
@@ -45,3 +48,39 @@ class CompileReleaseBatchTests(TransactionTestCase):
 
         self.assertEqual(result, [ocid])
         self.assertEqual(compiled_release.collection_file.filename, f"{ocid}.json")
+
+
+class CompileReleaseRangeTests(TransactionTestCase):
+    def setUp(self):
+        source = create_collection()
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+        source.save()
+
+        collection_file = CollectionFile(collection=source, filename="tests/fixtures/collection_file.json")
+        collection_file.save()
+        process_file(collection_file)
+
+        self.collection = create_collection(parent=source, transform_type=Collection.Transform.COMPILE_RELEASES)
+        self.collection.save()
+        self.ocids = sorted(set(Release.objects.values_list("ocid", flat=True)))
+
+    def test_ranges(self):
+        first = compile_release_range(self.collection, None, self.ocids[9])
+        second = compile_release_range(self.collection, self.ocids[9], self.ocids[19])
+
+        self.assertEqual(first, self.ocids[:10])
+        self.assertEqual(second, self.ocids[10:20])
+        self.assertEqual(
+            sorted(CompiledRelease.objects.filter(collection=self.collection).values_list("ocid", flat=True)),
+            self.ocids[:20],
+        )
+
+    def test_already_compiled(self):
+        compile_release_range(self.collection, None, self.ocids[9])
+
+        with self.assertLogs("process.processors.compiler", level="ERROR") as cm:
+            result = compile_release_range(self.collection, self.ocids[4], self.ocids[14])
+
+        self.assertEqual(result, self.ocids[10:15])
+        self.assertEqual(len(cm.records), 5)
+        self.assertEqual(CompiledRelease.objects.filter(collection=self.collection).count(), 15)
@@ -1,8 +1,9 @@
 from django.test import TransactionTestCase
 
 from process.exceptions import InvalidFormError
-from process.models import Collection
-from process.processors.loader import create_collection_file
+from process.models import Collection, CollectionFile, ProcessingStep
+from process.processors.loader import bulk_create_collection_files, create_collection_file
+from tests.fixtures import collection
 
 
 class CreateCollectionFileTests(TransactionTestCase):
@@ -25,3 +26,50 @@ class CreateCollectionFileTests(TransactionTestCase):
         collection_file = create_collection_file(collection, "/path")
 
         self.assertEqual(collection_file.collection, collection)
+
+
+class BulkCreateCollectionFilesTests(TransactionTestCase):
+    def test_batches(self):
+        source = collection()
+        source.save()
+
+        with self.settings(BULK_CREATE_BATCH_SIZE=2):
+            batches = list(bulk_create_collection_files(source, (f"/path/{i}" for i in range(5))))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(
+            [collection_file.filename for batch in batches for collection_file in batch],
+            [f"/path/{i}" for i in range(5)],
+        )
+        self.assertEqual(CollectionFile.objects.filter(collection=source).count(), 5)
+        self.assertEqual(
+            ProcessingStep.objects.filter(collection=source, name=ProcessingStep.Name.LOAD).count(),
+            5,
+        )
+
+    def test_integrity_error(self):
+        source = collection()
+        source.save()
+        create_collection_file(source, "/path/3")
+
+        with self.settings(BULK_CREATE_BATCH_SIZE=2), self.assertRaises(InvalidFormError) as e:
+            for _ in bulk_create_collection_files(source, (f"/path/{i}" for i in range(5))):
+                pass
+
+        self.assertEqual(str(e.exception), f"Collection {source.pk} already contains file '/path/3'")
+        # The first batch was committed, and the second batch was rolled back.
+        self.assertEqual(
+            list(CollectionFile.objects.filter(collection=source).order_by("pk").values_list("filename", flat=True)),
+            ["/path/3", "/path/0", "/path/1"],
+        )
+
+    def test_duplicate_in_batch(self):
+        source = collection()
+        source.save()
+
+        with self.settings(BULK_CREATE_BATCH_SIZE=4), self.assertRaises(InvalidFormError) as e:
+            for _ in bulk_create_collection_files(source, ["/path/0", "/path/1", "/path/2", "/path/1"]):
+                pass
+
+        self.assertEqual(str(e.exception), f"Collection {source.pk} already contains file '/path/1'")
+        self.assertFalse(CollectionFile.objects.filter(collection=source).exists())
@@ -1,4 +1,4 @@
-from django.test import TransactionTestCase
+from django.test import TransactionTestCase, override_settings
 
 from process.models import Collection, CollectionNote
 from process.processors.loader import create_collections
@@ -65,3 +65,72 @@ class CreateCollectionsTests(TransactionTestCase):
         self.assertEqual("testing note", CollectionNote.objects.get(collection=collection).note)
         self.assertEqual("testing note", CollectionNote.objects.get(collection=upgraded_collection).note)
         self.assertEqual("testing note", CollectionNote.objects.get(collection=compiled_collection).note)
+
+
+class CreateIncrementalCollectionsTests(TransactionTestCase):
+    def setUp(self):
+        self.base, self.base_upgraded, _ = create_collections("test", "2001-01-01 00:00:00", upgrade=True)
+
+    def test_incremental_from(self):
+        collection, upgraded_collection, _ = create_collections(
+            "test", "2001-01-02 00:00:00", upgrade=True, incremental_from=self.base.pk
+        )
+
+        self.assertEqual(collection.incremental_from, self.base)
+        self.assertEqual(upgraded_collection.incremental_from, self.base_upgraded)
+
+    def test_incremental_from_not_upgraded(self):
+        base, _, _ = create_collections("test", "2001-01-02 00:00:00")
+
+        collection, upgraded_collection, _ = create_collections(
+            "test", "2001-01-03 00:00:00", upgrade=True, incremental_from=base.pk
+        )
+
+        self.assertEqual(collection.incremental_from, base)
+        self.assertIsNone(upgraded_collection.incremental_from)
+
+    def test_incremental_from_other_source(self):
+        with self.assertRaises(ValueError) as e:
+            create_collections("other", "2001-01-02 00:00:00", incremental_from=self.base.pk)
+
+        self.assertEqual(
+            str(e.exception),
+            f"incremental_from: Base collection {self.base.pk} doesn't have the same source and transform type",
+        )
+
+    def test_incremental_from_compile(self):
+        collection, _, compiled_collection = create_collections(
+            "test", "2001-01-02 00:00:00", compile=True, incremental_from=self.base.pk
+        )
+
+        self.assertEqual(collection.incremental_from, self.base)
+        self.assertEqual(compiled_collection.parent, collection)
+
+    @override_settings(DEDUPLICATE_DATA=False)
+    def test_incremental_from_without_deduplication(self):
+        with self.assertRaises(ValueError) as e:
+            create_collections("test", "2001-01-02 00:00:00", incremental_from=self.base.pk)
+
+        self.assertEqual(
+            str(e.exception),
+            f"incremental_from: Base collection {self.base.pk} requires DEDUPLICATE_DATA to be enabled",
+        )
+
+
+class CreatePriorityCollectionsTests(TransactionTestCase):
+    def test_priority(self):
+        collections = create_collections("test", "2001-01-01 00:00:00", upgrade=True, compile=True, priority=5)
+
+        self.assertEqual([collection.priority for collection in collections], [5, 5, 5])
+        self.assertEqual(set(Collection.objects.values_list("priority", flat=True)), {5})
+
+    def test_priority_default(self):
+        collection, _, _ = create_collections("test", "2001-01-01 00:00:00")
+
+        self.assertEqual(Collection.objects.get(pk=collection.pk).priority, 0)
+
+    def test_priority_negative(self):
+        with self.assertRaises(ValueError) as e:
+            create_collections("test", "2001-01-01 00:00:00", priority=-1)
+
+        self.assertEqual(str(e.exception), "priority: Ensure this value is greater than or equal to 0.")
@@ -1,14 +1,34 @@
+import gzip
+import io
+import json
+import os.path
+import tempfile
+import zipfile
 from unittest.mock import MagicMock, patch
 
 from django.db import OperationalError
-from django.test import TransactionTestCase, override_settings
+from django.db.models import Sum
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
 from ocdskit.exceptions import UnknownFormatError
 from ocdskit.util import Format
 from psycopg.errors import ProgramLimitExceeded
 
-from process.exceptions import EmptyFormatError, UnsupportedFormatError
-from process.management.commands.file_worker import callback, process_file, set_data_type
+from process.exceptions import DecompressionError, EmptyFormatError, UnsupportedFormatError
+from process.management.commands.file_worker import (
+    ControlCodesFilter,
+    FileReader,
+    _discard_loaded_items,
+    _read_batches,
+    _serialize_batches,
+    _store_data,
+    callback,
+    finish,
+    process_file,
+    set_data_type,
+)
 from process.models import (
+    Collection,
+    CollectionCount,
     CollectionFile,
     CollectionNote,
     CompiledRelease,
@@ -18,9 +38,14 @@ from process.models import (
     Record,
     Release,
 )
+from process.util import get_hash_id_cache, open_file, split_file
 from tests.fixtures import collection
 
 
+def counted(collection_id, field):
+    return CollectionCount.objects.filter(collection_id=collection_id).aggregate(total=Sum(field, default=0))["total"]
+
+
 class DetectFormatTests(TransactionTestCase):
     def test_empty_format(self):
         source = collection()
@@ -62,6 +87,24 @@ class DetectFormatTests(TransactionTestCase):
 
         self.assertEqual(source.data_type, {})
 
+    @override_settings(FILE_CHUNK_SIZE=100)
+    def test_chunk(self):
+        source = collection()
+        source.save()
+
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "concatenated.json")
+        with open(path, "w") as f:
+            f.write("\n".join(json.dumps({"uri": "x" * 100, "releases": [{"ocid": str(i)}]}) for i in range(3)))
+
+        # Each chunk is a single value.
+        filenames = list(split_file(path))
+        self.assertEqual(len(filenames), 3)
+
+        set_data_type(source, CollectionFile(collection=source, filename=filenames[0]))
+
+        self.assertEqual(source.data_type, {"format": Format.release_package, "concatenated": True, "array": False})
+
     def test_file_not_found(self):
         source = collection()
         source.save()
@@ -76,6 +119,107 @@ class DetectFormatTests(TransactionTestCase):
         )
 
 
+@override_settings(ENABLE_CHECKER=True)
+@patch("process.management.commands.file_worker.create_step")
+class FinishTests(SimpleTestCase):
+    def test_success(self, create_step):
+        finish(1, 2, exception=None)
+
+        create_step.assert_called_once_with(ProcessingStep.Name.CHECK, 1, collection_file_id=2)
+
+    def test_skipped(self, create_step):
+        for exception in (FileNotFoundError(), DecompressionError(), EOFError()):
+            with self.subTest(exception=exception):
+                finish(1, 2, exception=exception)
+
+        create_step.assert_not_called()
+
+
+class ControlCodesFilterTests(SimpleTestCase):
+    def test_chunk_boundary(self):
+        data = b'{"a": "x\\u0000y", "b": "\\u0000", "c": "\\\\"}'
+        for buf_size in range(1, len(data) + 1):
+            with self.subTest(buf_size=buf_size):
+                reader = ControlCodesFilter(io.BytesIO(data))
+                chunks = []
+                while chunk := reader.read(buf_size):
+                    chunks.append(chunk)
+
+                self.assertEqual(b"".join(chunks), b'{"a": "xy", "b": "", "c": "\\\\"}')
+
+
+class FileReaderTests(SimpleTestCase):
+    def test_fast_path_and_fallback(self):
+        for filename, data_type in (
+            ("collection_file.json", {"format": Format.release_package, "concatenated": False, "array": True}),
+            ("record_package.json", {"format": Format.record_package, "concatenated": False, "array": True}),
+            ("compiled_release.json", {"format": Format.compiled_release, "concatenated": True, "array": False}),
+            (
+                "release_package_metadata_last.json",
+                {"format": Format.release_package, "concatenated": False, "array": False},
+            ),
+        ):
+            with self.subTest(filename=filename):
+                reader = FileReader(f"tests/fixtures/{filename}", data_type)
+                items = list(reader)
+
+                with patch("ijson.backend", "python"):
+                    fallback = FileReader(f"tests/fixtures/{filename}", data_type)
+                    fallback_items = list(fallback)
+
+                self.assertTrue(items)
+                self.assertEqual(items, fallback_items)
+                self.assertEqual(reader.package, fallback.package)
+
+    @override_settings(FILE_CHUNK_SIZE=1)
+    def test_chunks(self):
+        data_type = {"format": Format.compiled_release, "concatenated": True, "array": False}
+        expected_items = list(FileReader("tests/fixtures/compiled_release.json", data_type))
+
+        filenames = list(split_file("tests/fixtures/compiled_release.json"))
+        items = [item for filename in filenames for item in FileReader(filename, data_type)]
+
+        self.assertGreater(len(filenames), 1)
+        self.assertEqual(items, expected_items)
+
+    def test_compressed_and_archived(self):
+        data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+        expected = FileReader("tests/fixtures/collection_file.json", data_type)
+        expected_items = list(expected)
+
+        with open("tests/fixtures/collection_file.json", "rb") as f:
+            content = f.read()
+
+        with tempfile.TemporaryDirectory() as directory:
+            with gzip.open(os.path.join(directory, "file.json.gz"), "wb") as f:
+                f.write(content)
+            with zipfile.ZipFile(os.path.join(directory, "file.zip"), "w") as f:
+                f.writestr("data/file.json", content)
+
+            for filename in ("file.json.gz", "file.zip!data/file.json"):
+                with self.subTest(filename=filename):
+                    reader = FileReader(os.path.join(directory, filename), data_type)
+
+                    self.assertEqual(list(reader), expected_items)
+                    self.assertEqual(reader.package, expected.package)
+
+    @override_settings(BULK_CREATE_BATCH_BYTES=50000)
+    @patch("process.management.commands.file_worker.BUFFER_SIZE", 8192)
+    def test_read_batches_bytes(self):
+        data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+        expected_items = list(FileReader("tests/fixtures/collection_file.json", data_type))
+
+        for skip in (0, 50):
+            with self.subTest(skip=skip):
+                reader = FileReader("tests/fixtures/collection_file.json", data_type)
+                batches = [batch for batch, _ in _read_batches(reader, skip)]
+
+                # The file is 497,376 bytes, for 100 items.
+                self.assertGreater(len(batches), (100 - skip) // 15)
+                self.assertLess(max(len(batch) for batch in batches), 20)
+                self.assertEqual([item for batch in batches for item in batch], expected_items[skip:])
+
+
 class ProcessFileTests(TransactionTestCase):
     fixtures = ["tests/fixtures/complete_db.json"]
 
@@ -155,6 +299,7 @@ class ProcessFileWithoutDeduplicationTests(TransactionTestCase):
         self.assertEqual(PackageData.objects.count(), 1)
         self.assertEqual(Data.objects.count(), 2)
         self.assertEqual(set(records.values_list("ocid", flat=True)), {"ocds-aaa111", "ocds-bbb222"})
+        self.assertEqual(counted(source.pk, "records"), 2)
 
         package_data = PackageData.objects.get()
 
@@ -177,6 +322,453 @@ class ProcessFileWithoutDeduplicationTests(TransactionTestCase):
         self.assertEqual(PackageData.objects.count(), 0)
         self.assertEqual(Data.objects.count(), 2)
         self.assertEqual(set(compiled_releases.values_list("ocid", flat=True)), {"ocds-aaa111", "ocds-bbb222"})
+        self.assertEqual(counted(source.pk, "compiled_releases"), 2)
+
+    def test_non_string_values(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        filename = os.path.join(directory, "release_package.json")
+        with open(filename, "w") as f:
+            f.write('{"releases": [{"ocid": 1, "id": 2, "date": true}, {"ocid": "ocds-1", "id": 1.10, "date": ""}]}')
+
+        source = collection()
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": False}
+        source.save()
+
+        collection_file = CollectionFile(collection=source, filename=filename)
+        collection_file.save()
+
+        process_file(collection_file)
+
+        self.assertEqual(
+            sorted(Release.objects.values_list("ocid", "release_id", "release_date")),
+            [("1", "2", "True"), ("ocds-1", "1.10", "")],
+        )
+
+    def test_package_metadata_after_releases(self):
+        source = collection()
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": False}
+        source.save()
+
+        collection_file = CollectionFile(
+            collection=source, filename="tests/fixtures/release_package_metadata_last.json"
+        )
+        collection_file.save()
+
+        process_file(collection_file)
+
+        releases = Release.objects.filter(collection_file=collection_file)
+        package_data = PackageData.objects.get()
+
+        self.assertEqual(releases.count(), 2)
+        self.assertEqual(releases.filter(package_data=package_data).count(), 2)
+        self.assertEqual(
+            package_data.data,
+            {"version": "1.1", "uri": "http://example.com/release", "publisher": {"name": "Example"}},
+        )
+
+
+@override_settings(DEDUPLICATE_DATA=False, COPY_DATA=True)
+class ProcessFileWithCopyTests(ProcessFileWithoutDeduplicationTests):
+    pass
+
+
+@override_settings(DEDUPLICATE_DATA=True)
+class ProcessFileWithDeduplicationTests(TransactionTestCase):
+    def test_bulk_store_release_package(self):
+        data_ids = []
+        package_data_ids = set()
+        for index, batch_size in enumerate((1, 30, 1000)):
+            with self.subTest(batch_size=batch_size), override_settings(BULK_CREATE_BATCH_SIZE=batch_size):
+                source = collection()
+                source.data_version = f"2001-01-0{index + 1} 00:00:00"
+                source.data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+                source.save()
+
+                collection_file = CollectionFile(collection=source, filename="tests/fixtures/collection_file.json")
+                collection_file.save()
+
+                process_file(collection_file)
+
+                releases = Release.objects.filter(collection_file=collection_file)
+                data_ids.append(set(releases.values_list("data_id", flat=True)))
+                package_data_ids.update(releases.values_list("package_data_id", flat=True))
+
+                self.assertEqual(releases.count(), 100)
+                self.assertEqual(len(data_ids[-1]), 100)
+                self.assertEqual(Data.objects.count(), 100)
+
+        self.assertEqual(data_ids[0], data_ids[1])
+        self.assertEqual(data_ids[0], data_ids[2])
+        self.assertEqual(len(package_data_ids), 1)
+        # The "links" field follows the "releases" field.
+        self.assertIn("links", PackageData.objects.get(pk=package_data_ids.pop()).data)
+
+    def test_upgrade_single_pass(self):
+        source = collection()
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": False}
+        source.save()
+        upgraded = collection(parent=source, transform_type=Collection.Transform.UPGRADE_10_11)
+        upgraded.data_type = source.data_type
+        upgraded.save()
+
+        collection_file = CollectionFile(
+            collection=source, filename="tests/fixtures/release_package_metadata_last.json"
+        )
+        collection_file.save()
+
+        with patch("process.management.commands.file_worker.open_file", wraps=open_file) as mock_open_file:
+            upgraded_collection_file_id = process_file(collection_file)
+
+        mock_open_file.assert_called_once()
+
+        upgraded_collection_file = CollectionFile.objects.get(pk=upgraded_collection_file_id)
+        package_data = PackageData.objects.get()
+
+        self.assertEqual(upgraded_collection_file.collection, upgraded)
+        self.assertEqual(Release.objects.filter(collection_file=collection_file).count(), 2)
+        self.assertEqual(Release.objects.filter(collection_file=upgraded_collection_file).count(), 2)
+        self.assertEqual(Release.objects.filter(package_data=package_data).count(), 4)
+        self.assertIn("uri", package_data.data)
+
+
+@override_settings(DEDUPLICATE_DATA=True)
+class ProcessFileUpgradeTests(TransactionTestCase):
+    def process_file(self):
+        source = collection()
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": False}
+        source.save()
+        upgraded = collection(parent=source, transform_type=Collection.Transform.UPGRADE_10_11)
+        upgraded.data_type = source.data_type
+        upgraded.save()
+
+        releases = [
+            {
+                "ocid": f"ocds-213czf-{i}",
+                "id": str(i),
+                "date": "2001-02-03T04:05:06Z",
+                "tender": {"tenderers": [{"name": "Acme Inc.", "identifier": {"id": i}}]},
+                "awards": [
+                    {
+                        "suppliers": [
+                            {"name": "Acme Inc.", "identifier": {"id": i}, "additionalIdentifiers": [{"id": "a"}]}
+                        ]
+                    }
+                ],
+            }
+            for i in range(3)
+        ]
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        filename = os.path.join(directory, "release_package.json")
+        with open(filename, "w") as f:
+            json.dump({"uri": "http://example.com", "version": "1.0", "releases": releases}, f)
+
+        collection_file = CollectionFile(collection=source, filename=filename)
+        collection_file.save()
+
+        upgraded_collection_file_id = process_file(collection_file)
+
+        return collection_file, CollectionFile.objects.get(pk=upgraded_collection_file_id)
+
+    def assert_upgraded(self, collection_file, upgraded_collection_file):
+        original = Release.objects.filter(collection_file=collection_file).order_by("ocid")
+        upgraded = Release.objects.filter(collection_file=upgraded_collection_file).order_by("ocid")
+
+        self.assertEqual(
+            list(original.values_list("ocid", "release_id")), list(upgraded.values_list("ocid", "release_id"))
+        )
+        for release in original:
+            self.assertNotIn("parties", release.data.data)
+        for release in upgraded:
+            self.assertEqual(len(release.data.data["parties"]), 1)
+
+        # The warnings are collected per batch, not per item.
+        notes = CollectionNote.objects.filter(collection=upgraded_collection_file.collection)
+        self.assertEqual(notes.count(), 2)
+        for note in notes:
+            self.assertEqual(note.code, CollectionNote.Level.WARNING)
+            self.assertIn('party in "supplier" role differs from party in ["tenderer"] roles', note.note)
+
+    @override_settings(BULK_CREATE_BATCH_SIZE=2)
+    def test_upgrade(self):
+        self.assert_upgraded(*self.process_file())
+
+    @override_settings(BULK_CREATE_BATCH_SIZE=2, FILE_WORKER_PROCESSES=2)
+    def test_upgrade_process_pool(self):
+        self.assert_upgraded(*self.process_file())
+
+
+@override_settings(BULK_CREATE_BATCH_SIZE=30)
+class ProcessFileResumeTests(TransactionTestCase):
+    def setUp(self):
+        source = collection()
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+        source.save()
+        upgraded = collection(parent=source, transform_type=Collection.Transform.UPGRADE_10_11)
+        upgraded.data_type = source.data_type
+        upgraded.save()
+
+        self.collection_file = CollectionFile(collection=source, filename="tests/fixtures/collection_file.json")
+        self.collection_file.save()
+
+    def process_file_until_deadlock(self):
+        calls = []
+
+        def store_data(*args):
+            # Fail on the third batch of the original collection.
+            calls.append(args)
+            if len(calls) == 5:
+                raise OperationalError("deadlock detected")
+            return _store_data(*args)
+
+        with (
+            patch("process.management.commands.file_worker._store_data", side_effect=store_data),
+            self.assertRaises(OperationalError),
+        ):
+            process_file(self.collection_file)
+
+    def test_resume(self):
+        self.process_file_until_deadlock()
+
+        self.assertEqual(CollectionFile.objects.get(pk=self.collection_file.pk).loaded_items_count, 60)
+        self.assertEqual(Release.objects.filter(collection_file=self.collection_file).count(), 60)
+        self.assertEqual(counted(self.collection_file.collection_id, "releases"), 60)
+
+        upgraded_collection_file_id = process_file(self.collection_file)
+
+        releases = Release.objects.filter(collection_file=self.collection_file)
+        self.assertEqual(CollectionFile.objects.get(pk=self.collection_file.pk).loaded_items_count, 100)
+        self.assertEqual(releases.count(), 100)
+        self.assertEqual(len(set(releases.values_list("data_id", flat=True))), 100)
+        self.assertEqual(len(set(releases.values_list("package_data_id", flat=True))), 1)
+        self.assertEqual(Release.objects.filter(collection_file_id=upgraded_collection_file_id).count(), 100)
+        self.assertEqual(CollectionFile.objects.filter(filename=self.collection_file.filename).count(), 2)
+        for collection_file in (self.collection_file.pk, upgraded_collection_file_id):
+            collection_id = CollectionFile.objects.get(pk=collection_file).collection_id
+            self.assertEqual(counted(collection_id, "releases"), 100)
+
+    @override_settings(FILE_WORKER_QUEUE_SIZE=0)
+    def test_concurrent_delivery(self):
+        self.process_file_until_deadlock()
+
+        delivered = []
+
+        def serialize_batches(*args, **kwargs):
+            for batch in _serialize_batches(*args, **kwargs):
+                # Another delivery of the same message stores the remaining items, after this delivery read the
+                # checkpoint and its first batch.
+                if not delivered:
+                    delivered.append(True)
+                    process_file(CollectionFile.objects.get(pk=self.collection_file.pk))
+                yield batch
+
+        with patch("process.management.commands.file_worker._serialize_batches", side_effect=serialize_batches):
+            upgraded_collection_file_id = process_file(self.collection_file)
+
+        releases = Release.objects.filter(collection_file=self.collection_file)
+        self.assertEqual(CollectionFile.objects.get(pk=self.collection_file.pk).loaded_items_count, 100)
+        self.assertEqual(releases.count(), 100)
+        self.assertEqual(len(set(releases.values_list("data_id", flat=True))), 100)
+        self.assertEqual(Release.objects.filter(collection_file_id=upgraded_collection_file_id).count(), 100)
+        for collection_file in (self.collection_file.pk, upgraded_collection_file_id):
+            collection_id = CollectionFile.objects.get(pk=collection_file).collection_id
+            self.assertEqual(counted(collection_id, "releases"), 100)
+
+    def test_discard_loaded_items(self):
+        self.process_file_until_deadlock()
+
+        _discard_loaded_items(self.collection_file)
+
+        self.assertEqual(CollectionFile.objects.get(pk=self.collection_file.pk).loaded_items_count, 0)
+        self.assertFalse(Release.objects.exists())
+        self.assertEqual(CollectionFile.objects.filter(filename=self.collection_file.filename).count(), 1)
+        self.assertEqual({counted(pk, "releases") for pk in Collection.objects.values_list("pk", flat=True)}, {0})
+
+
+@override_settings(REUSE_FILES=True, DEDUPLICATE_DATA=True)
+class ProcessFileReuseTests(TransactionTestCase):
+    def process_file(self, day, *, upgrade=False):
+        source = collection()
+        source.data_version = f"2001-01-0{day} 00:00:00"
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+        source.save()
+        if upgrade:
+            upgraded = collection(parent=source, transform_type=Collection.Transform.UPGRADE_10_11)
+            upgraded.data_version = source.data_version
+            upgraded.data_type = source.data_type
+            upgraded.save()
+
+        collection_file = CollectionFile(collection=source, filename="tests/fixtures/collection_file.json")
+        collection_file.save()
+
+        upgraded_collection_file_id = process_file(collection_file)
+
+        return collection_file, upgraded_collection_file_id
+
+    def complete(self, collection_file):
+        Collection.objects.filter(pk=collection_file.collection_id).update(completed_at="2001-01-01 00:00:00")
+
+    def assert_copied(self, old, new):
+        fields = ("package_data_id", "data_id", "ocid", "release_id", "release_date")
+        self.assertEqual(
+            list(Release.objects.filter(collection_file=new).order_by("id").values_list(*fields)),
+            list(Release.objects.filter(collection_file=old).order_by("id").values_list(*fields)),
+        )
+        self.assertEqual(
+            set(Release.objects.filter(collection_file=new).values_list("collection_id", flat=True)),
+            {CollectionFile.objects.get(pk=new).collection_id},
+        )
+
+    def test_reuse(self):
+        old, _ = self.process_file(1)
+        self.complete(old)
+
+        with patch("process.management.commands.file_worker.FileReader") as reader:
+            new, _ = self.process_file(2)
+
+        reader.assert_not_called()
+        self.assert_copied(old.pk, new.pk)
+        self.assertEqual(Release.objects.filter(collection_file=new).count(), 100)
+        self.assertEqual(counted(new.collection_id, "releases"), 100)
+        self.assertEqual(
+            CollectionFile.objects.get(pk=new.pk).hash_md5, CollectionFile.objects.get(pk=old.pk).hash_md5
+        )
+        self.assertEqual(CollectionFile.objects.get(pk=new.pk).loaded_items_count, 100)
+
+    def test_reuse_upgrade(self):
+        old, old_upgraded_id = self.process_file(1, upgrade=True)
+        self.complete(old)
+
+        with patch("process.management.commands.file_worker.FileReader") as reader:
+            new, new_upgraded_id = self.process_file(2, upgrade=True)
+
+        reader.assert_not_called()
+        self.assert_copied(old.pk, new.pk)
+        self.assert_copied(old_upgraded_id, new_upgraded_id)
+
+    def test_no_reuse_if_incomplete(self):
+        self.process_file(1)
+
+        with patch("process.management.commands.file_worker.FileReader", wraps=FileReader) as reader:
+            new, _ = self.process_file(2)
+
+        reader.assert_called_once()
+        self.assertEqual(Release.objects.filter(collection_file=new).count(), 100)
+
+    @override_settings(REUSE_FILES=False)
+    def test_disabled(self):
+        old, _ = self.process_file(1)
+        self.complete(old)
+
+        self.assertEqual(CollectionFile.objects.get(pk=old.pk).hash_md5, "")
+
+
+@override_settings(DEDUPLICATE_DATA=True)
+class ProcessFileIncrementalTests(TransactionTestCase):
+    def test_incremental_from(self):
+        data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+        base = collection(data_type=data_type)
+        base.save()
+        base_file = CollectionFile(collection=base, filename="tests/fixtures/collection_file.json")
+        base_file.save()
+        process_file(base_file)
+
+        with open("tests/fixtures/collection_file.json") as f:
+            packages = json.load(f)
+        releases = packages[0]["releases"]
+        for release in releases[:3]:
+            release["tag"] = ["tenderUpdate"]
+        releases.append({**releases[-1], "id": "new"})
+
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        filename = os.path.join(directory, "collection_file.json")
+        with open(filename, "w") as f:
+            json.dump(packages, f)
+
+        data_count = Data.objects.count()
+
+        source = collection(data_type=data_type, incremental_from=base)
+        source.data_version = "2001-01-02 00:00:00"
+        source.save()
+        collection_file = CollectionFile(collection=source, filename=filename)
+        collection_file.save()
+
+        process_file(collection_file)
+
+        stored = Release.objects.filter(collection_file=collection_file)
+        base_data_ids = set(Release.objects.filter(collection=base).values_list("data_id", flat=True))
+        changed = stored.exclude(data_id__in=base_data_ids)
+
+        # All items are stored, and unchanged items reference the base collection's data.
+        self.assertEqual(stored.count(), 101)
+        self.assertEqual(Data.objects.count(), data_count + 4)
+        self.assertEqual(
+            sorted(changed.values_list("release_id", flat=True)),
+            sorted([release["id"] for release in releases[:3]] + ["new"]),
+        )
+        self.assertEqual(CollectionFile.objects.get(pk=collection_file.pk).loaded_items_count, 101)
+
+        # An incremental collection can be the base of another.
+        chained = collection(data_type=data_type, incremental_from=source)
+        chained.data_version = "2001-01-03 00:00:00"
+        chained.save()
+        chained_file = CollectionFile(collection=chained, filename=filename)
+        chained_file.save()
+
+        process_file(chained_file)
+
+        self.assertEqual(
+            list(
+                Release.objects.filter(collection_file=chained_file).order_by("id").values_list("data_id", flat=True)
+            ),
+            list(stored.order_by("id").values_list("data_id", flat=True)),
+        )
+        self.assertEqual(Data.objects.count(), data_count + 4)
+
+
+@override_settings(DEDUPLICATE_DATA=True, DATA_CACHE_SIZE=1000)
+class CallbackStaleCacheTests(TransactionTestCase):
+    def setUp(self):
+        get_hash_id_cache.cache_clear()
+
+    def create_collection_file(self, data_version):
+        source = collection()
+        source.data_version = data_version
+        source.data_type = {"format": Format.release_package, "concatenated": False, "array": True}
+        source.save()
+
+        collection_file = CollectionFile(collection=source, filename="tests/fixtures/collection_file.json")
+        collection_file.save()
+
+        return collection_file
+
+    @patch("process.management.commands.file_worker.publish")
+    @patch("process.management.commands.file_worker.nack")
+    @patch("process.management.commands.file_worker.ack")
+    def test_retries(self, ack, nack, publish):
+        process_file(self.create_collection_file("2001-01-01 00:00:00"))
+
+        # Like the wiper worker and deleteorphan command, while the ids remain cached.
+        Release.objects.all().delete()
+        Data.objects.all().delete()
+        PackageData.objects.all().delete()
+
+        collection_file = self.create_collection_file("2001-01-02 00:00:00")
+        ProcessingStep.objects.create(
+            name=ProcessingStep.Name.LOAD, collection=collection_file.collection, collection_file=collection_file
+        )
+
+        method = MagicMock(delivery_tag=1)
+        input_message = {"collection_id": collection_file.collection_id, "collection_file_id": collection_file.pk}
+
+        with self.assertLogs("process.management.commands.file_worker", level="WARNING") as logs:
+            callback(MagicMock(), MagicMock(), method, MagicMock(), input_message)
+
+        self.assertIn("Stale cache", logs.output[0])
+        ack.assert_called_once()
+        nack.assert_not_called()
+        publish.assert_called_once()
+        self.assertEqual(Release.objects.filter(collection_file=collection_file).count(), 100)
+        self.assertFalse(ProcessingStep.objects.filter(name=ProcessingStep.Name.LOAD).exists())
 
 
 class CallbackTests(TransactionTestCase):
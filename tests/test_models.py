@@ -1,4 +1,10 @@
+from decimal import Decimal
+from unittest.mock import patch, sentinel
+
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Cast
 from django.test import TestCase
 
 from process.models import (
@@ -7,6 +13,7 @@ from process.models import (
     CollectionNote,
     CompiledRelease,
     Data,
+    JSONField,
     PackageData,
     Record,
     Release,
@@ -164,6 +171,57 @@ class CollectionTests(TestCase):
         self.assertEqual(upgraded.get_compiled_collection(), compiled)
 
 
+class JSONFieldTests(TestCase):
+    def assert_round_trip(self, value, expected):
+        obj = collection()
+        obj.save()
+        note = CollectionNote.objects.create(collection=obj, note="", data=value)
+
+        self.assertEqual(CollectionNote.objects.get(pk=note.pk).data, expected)
+        self.assertEqual(CollectionNote.objects.filter(pk=note.pk).values_list("data", flat=True).get(), expected)
+
+    def test_decimal(self):
+        self.assert_round_trip({"a": Decimal("1.10"), "b": [Decimal(2)]}, {"a": 1.1, "b": [2]})
+
+    def test_non_ascii(self):
+        self.assert_round_trip({"a": "é\U0001f600"}, {"a": "é\U0001f600"})
+
+    def test_big_integer(self):
+        self.assert_round_trip({"a": 2**70 + 1, "b": -(2**63) - 1}, {"a": 2**70 + 1, "b": -(2**63) - 1})
+
+    def test_key_transform(self):
+        obj = collection()
+        obj.save()
+        CollectionNote.objects.create(collection=obj, note="", data={"a": {"b": Decimal("1.5")}})
+
+        self.assertEqual(CollectionNote.objects.values_list("data__a", flat=True).get(), {"b": 1.5})
+
+    def test_expression(self):
+        obj = collection()
+        obj.save()
+        note = CollectionNote.objects.create(collection=obj, note="", data={})
+
+        CollectionNote.objects.filter(pk=note.pk).update(data=Value({"a": Decimal("1.5")}, output_field=JSONField()))
+        self.assertEqual(CollectionNote.objects.get(pk=note.pk).data, {"a": 1.5})
+
+        CollectionNote.objects.filter(pk=note.pk).update(data=Value(None, output_field=JSONField()))
+        self.assertIsNone(CollectionNote.objects.get(pk=note.pk).data)
+        self.assertTrue(CollectionNote.objects.filter(data=Value(None, output_field=JSONField())).exists())
+
+        note.data = Cast(Value('{"b": 2}'), JSONField())
+        note.save()
+        self.assertEqual(CollectionNote.objects.get(pk=note.pk).data, {"b": 2})
+
+    @patch("django.db.models.JSONField.get_db_prep_value", return_value=sentinel.prepared)
+    def test_get_db_prep_value_expression(self, get_db_prep_value):
+        field = JSONField()
+
+        for value in (Value({"a": 1}, output_field=field), F("data"), Cast(Value("{}"), field)):
+            with self.subTest(value=value):
+                self.assertIs(field.get_db_prep_value(value, connection), sentinel.prepared)
+        self.assertIsNot(field.get_db_prep_value({"a": 1}, connection), sentinel.prepared)
+
+
 class CollectionNoteTests(TestCase):
     def test_str(self):
         obj = CollectionNote()
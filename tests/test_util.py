@@ -1,12 +1,51 @@
+import functools
+import gzip
+import io
 import json
+import logging
+import os.path
+import tarfile
+import tempfile
+import threading
+import zipfile
 from collections import OrderedDict
-from unittest.mock import patch
+from decimal import Decimal
+from unittest.mock import Mock, patch
 
-from django.test import SimpleTestCase, TestCase, override_settings
+import ijson
+import simplejson
+import zstandard
+from django.db import DataError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from ocdskit.upgrade import upgrade_10_11
+from pika.exceptions import AMQPConnectionError, ConnectionClosed, StreamLostError
 
 from process.models import CollectionNote, Data
-from process.util import create_logger_note, get_or_create
+from process.util import (
+    DECOMPRESSION_ERRORS,
+    BloomFilter,
+    Prefetcher,
+    Publisher,
+    _close_publishers,
+    _get_tar_members,
+    bulk_get_or_create,
+    bulk_get_or_create_ids,
+    canonical_json,
+    capture_warnings,
+    close_connections,
+    consume,
+    create_logger_note,
+    get_hash,
+    get_hash_id_cache,
+    get_or_create,
+    get_publisher,
+    open_file,
+    serialize_json,
+    split_archive_member,
+    split_chunk,
+    split_file,
+    walk,
+)
 
 
 class UtilTests(SimpleTestCase):
@@ -30,6 +69,17 @@ class UtilTests(SimpleTestCase):
             '{"id": "3c9756cf8983b14066a034079aa7aae4", "name": "Acme Inc.", "identifier": {"id": 1}}\n',
         )
 
+    def test_capture_warnings_other_thread(self):
+        logger = logging.getLogger("ocdskit")
+
+        with capture_warnings("ocdskit") as stream:
+            thread = threading.Thread(target=logger.warning, args=("other",))
+            thread.start()
+            thread.join()
+            logger.warning("this")
+
+        self.assertEqual(stream.getvalue(), "this\n")
+
     @patch("process.util.create_note")
     def test_create_logger_note_not_called(self, create_note):
         with create_logger_note("collection", "ocdskit"):
@@ -38,6 +88,468 @@ class UtilTests(SimpleTestCase):
         create_note.assert_not_called()
 
 
+def blocking_client():
+    return Mock(
+        exchange="",
+        content_type="application/json",
+        delivery_mode=2,
+        format_routing_key=lambda routing_key: routing_key,
+        encode=lambda message, _content_type: message,
+    )
+
+
+def published(client):
+    return [
+        (c.kwargs["body"], c.kwargs["routing_key"], c.kwargs["properties"].priority)
+        for c in client.channel.basic_publish.call_args_list
+    ]
+
+
+@patch("process.util.Blocking")
+class PublisherTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(_close_publishers)
+
+    def test_publish_many(self, blocking):
+        blocking.return_value = blocking_client()
+        publisher = Publisher()
+
+        publisher.publish_many([({"a": 1}, "x"), ({"b": 2}, "y")])
+        publisher.publish({"c": 3}, "z", priority=5)
+
+        blocking.assert_called_once()
+        blocking.return_value.channel.tx_select.assert_called_once_with()
+        self.assertEqual(blocking.return_value.channel.tx_commit.call_count, 2)
+        self.assertEqual(
+            published(blocking.return_value),
+            [({"a": 1}, "x", None), ({"b": 2}, "y", None), ({"c": 3}, "z", 5)],
+        )
+
+    def test_reconnect(self, blocking):
+        lost = blocking_client()
+        lost.channel.basic_publish.side_effect = [None, StreamLostError]
+        blocking.side_effect = [lost, blocking_client()]
+        publisher = Publisher()
+
+        publisher.publish_many([({"a": 1}, "x"), ({"b": 2}, "y"), ({"c": 3}, "z")])
+
+        self.assertEqual(blocking.call_count, 2)
+        self.assertEqual(published(lost), [({"a": 1}, "x", None), ({"b": 2}, "y", None)])
+        lost.channel.tx_commit.assert_not_called()
+        self.assertEqual(
+            published(publisher.client), [({"a": 1}, "x", None), ({"b": 2}, "y", None), ({"c": 3}, "z", None)]
+        )
+        publisher.client.channel.tx_commit.assert_called_once_with()
+
+    def test_reconnect_idle(self, blocking):
+        lost = blocking_client()
+        lost.connection.process_data_events.side_effect = ConnectionClosed(320, "CONNECTION_FORCED")
+        blocking.side_effect = [lost, blocking_client()]
+        publisher = Publisher()
+        publisher.publish({"a": 1}, "x")
+
+        publisher.publish({"b": 2}, "y")
+
+        self.assertEqual(blocking.call_count, 2)
+        self.assertEqual(published(publisher.client), [({"b": 2}, "y", None)])
+
+    def test_reconnect_once(self, blocking):
+        blocking.side_effect = AMQPConnectionError
+        publisher = Publisher()
+
+        with self.assertRaises(AMQPConnectionError):
+            publisher.publish({"a": 1}, "x")
+
+        self.assertEqual(blocking.call_count, 2)
+
+    def test_get_publisher(self, blocking):
+        with get_publisher() as client, get_publisher() as other:
+            self.assertIsNot(client, other)
+        with get_publisher() as reused:
+            self.assertIs(reused, client)
+
+
+@patch("process.util.AsyncConsumer")
+class ConsumeTests(SimpleTestCase):
+    def test_default(self, consumer):
+        consume(on_message_callback=None, queue="x", arguments={"x-consumer-timeout": 1})
+
+        self.assertEqual(consumer.call_args.kwargs["arguments"], {"x-consumer-timeout": 1})
+
+    @override_settings(RABBIT_MAX_PRIORITY=10)
+    def test_max_priority(self, consumer):
+        consume(on_message_callback=None, queue="x", arguments={"x-consumer-timeout": 1})
+        consume(on_message_callback=None, queue="y")
+
+        self.assertEqual(
+            [c.kwargs["arguments"] for c in consumer.call_args_list],
+            [{"x-consumer-timeout": 1, "x-max-priority": 10}, {"x-max-priority": 10}],
+        )
+
+
+class CloseConnectionsTests(TransactionTestCase):
+    def connect(self, max_age):
+        connection.close()
+        with patch.dict(connection.settings_dict, {"CONN_MAX_AGE": max_age}):
+            connection.ensure_connection()
+        return connection.connection
+
+    def test_reuse(self):
+        raw = self.connect(60)
+
+        close_connections()
+
+        self.assertIs(connection.connection, raw)
+
+    def test_obsolete(self):
+        self.connect(0)
+
+        close_connections()
+
+        self.assertIsNone(connection.connection)
+
+    def test_transaction(self):
+        self.connect(60)
+        with connection.cursor() as cursor:
+            cursor.execute("BEGIN")
+
+        close_connections()
+
+        self.assertIsNone(connection.connection)
+
+    def test_aborted_transaction(self):
+        self.connect(60)
+        with connection.cursor() as cursor:
+            cursor.execute("BEGIN")
+            with self.assertRaises(DataError):
+                cursor.execute("SELECT 1/0")
+
+        close_connections()
+
+        self.assertIsNone(connection.connection)
+
+
+class ArchiveTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    def path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def add_tar_member(self, archive, name, content):
+        info = tarfile.TarInfo(name)
+        info.size = len(content)
+        archive.addfile(info, io.BytesIO(content))
+
+    def test_walk_and_open_file(self):
+        with open(self.path("plain.json"), "wb") as f:
+            f.write(b'{"plain":1}')
+        with gzip.open(self.path("compressed.json.gz"), "wb") as f:
+            f.write(b'{"gz":1}')
+        with zstandard.open(self.path("compressed.json.zst"), "wb") as f:
+            f.write(b'{"zst":1}')
+        with zipfile.ZipFile(self.path("archive.zip"), "w") as f:
+            f.writestr("a/1.json", b'{"zip":1}')
+            f.writestr("a/.hidden", b"")
+            f.writestr("2.json.gz", gzip.compress(b'{"zip":2}'))
+            f.mkdir("empty")
+        with tarfile.open(self.path("archive.tar.gz"), "w:gz") as f:
+            self.add_tar_member(f, "1.json", b'{"tgz":1}')
+            self.add_tar_member(f, "2.json", b'{"tgz":2}')
+        with zstandard.open(self.path("archive.tar.zst"), "wb") as f, tarfile.open(fileobj=f, mode="w|") as tar:
+            self.add_tar_member(tar, "1.json", b'{"tzst":1}')
+
+        filenames = sorted(walk([self.directory]))
+
+        self.assertEqual(
+            filenames,
+            [
+                self.path("archive.tar.gz!1.json"),
+                self.path("archive.tar.gz!2.json"),
+                self.path("archive.tar.zst!1.json"),
+                self.path("archive.zip!2.json.gz"),
+                self.path("archive.zip!a/1.json"),
+                self.path("compressed.json.gz"),
+                self.path("compressed.json.zst"),
+                self.path("plain.json"),
+            ],
+        )
+
+        contents = []
+        for filename in filenames:
+            with open_file(filename) as f:
+                contents.append(f.read())
+
+        self.assertEqual(
+            contents,
+            [
+                b'{"tgz":1}',
+                b'{"tgz":2}',
+                b'{"tzst":1}',
+                b'{"zip":2}',
+                b'{"zip":1}',
+                b'{"gz":1}',
+                b'{"zst":1}',
+                b'{"plain":1}',
+            ],
+        )
+
+        self.assertEqual(
+            sorted(walk([self.directory], expand=False)),
+            [
+                self.path("archive.tar.gz"),
+                self.path("archive.tar.zst"),
+                self.path("archive.zip"),
+                self.path("compressed.json.gz"),
+                self.path("compressed.json.zst"),
+                self.path("plain.json"),
+            ],
+        )
+
+    def test_open_file_tar(self):
+        with tarfile.open(self.path("archive.tar"), "w") as f:
+            for i in range(3):
+                self.add_tar_member(f, f"{i}.json", f'{{"tar":{i}}}'.encode())
+
+        _get_tar_members.cache_clear()
+
+        contents = []
+        for filename in walk([self.path("archive.tar")]):
+            with open_file(filename) as f:
+                contents.append(f.read())
+
+        self.assertEqual(contents, [b'{"tar":0}', b'{"tar":1}', b'{"tar":2}'])
+        # The archive is indexed once.
+        self.assertEqual(_get_tar_members.cache_info().misses, 1)
+
+    def test_open_file_missing(self):
+        with zipfile.ZipFile(self.path("archive.zip"), "w") as f:
+            f.writestr("1.json", b"{}")
+        with tarfile.open(self.path("archive.tar"), "w") as f:
+            self.add_tar_member(f, "1.json", b"{}")
+
+        for filename in ("missing.json", "missing.zip!1.json", "archive.zip!2.json", "archive.tar!2.json"):
+            with self.subTest(filename=filename), self.assertRaises(FileNotFoundError), open_file(self.path(filename)):
+                pass
+
+    def test_open_file_corrupt(self):
+        content = gzip.compress(b'{"gz":1}' * 100)
+        with open(self.path("header.json.gz"), "wb") as f:
+            f.write(b"not gzip" + content)
+        with open(self.path("deflate.json.gz"), "wb") as f:
+            f.write(content[:10] + b"\xff" * 20 + content[30:])
+        with open(self.path("truncated.json.gz"), "wb") as f:
+            f.write(content[:-10])
+        with open(self.path("corrupt.json.bz2"), "wb") as f:
+            f.write(b"BZh9" + b"\x00" * 100)
+        with zipfile.ZipFile(self.path("archive.zip"), "w") as f:
+            f.writestr("1.json.gz", content[:10] + b"\xff" * 20 + content[30:])
+
+        for filename in (
+            "header.json.gz",
+            "deflate.json.gz",
+            "truncated.json.gz",
+            "corrupt.json.bz2",
+            "archive.zip!1.json.gz",
+        ):
+            with (
+                self.subTest(filename=filename),
+                self.assertRaises(DECOMPRESSION_ERRORS),
+                open_file(self.path(filename)) as f,
+            ):
+                f.read()
+
+    def test_split_archive_member(self):
+        self.assertEqual(split_archive_member("a!b.json"), ("a!b.json", None))
+        self.assertEqual(split_archive_member("a!b.zip!c!d.json"), ("a!b.zip", "c!d.json"))
+        self.assertEqual(split_archive_member("a.TAR.GZ!b.json"), ("a.TAR.GZ", "b.json"))
+
+
+@override_settings(FILE_CHUNK_SIZE=1)
+class SplitFileTests(SimpleTestCase):
+    items = [{"id": i, "text": '}]{["\\\\\\"' * i, "nested": [[i], [{"a": "]"}]]} for i in range(20)]
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    def read_chunks(self, filename, content):
+        path = os.path.join(self.directory, filename)
+        with open(path, "w") as f:
+            f.write(content)
+
+        filenames = list(split_file(path))
+        contents = []
+        for name in filenames:
+            with open_file(name) as f:
+                contents.append(b"".join(iter(functools.partial(f.read, 5), b"")))
+        return filenames, contents
+
+    def test_array(self):
+        for buffer_size in (1, 7, 1024):
+            with self.subTest(buffer_size=buffer_size), patch("process.util.BUFFER_SIZE", buffer_size):
+                filenames, contents = self.read_chunks("array.json", f" {json.dumps(self.items, indent=2)}\n")
+
+                self.assertEqual(len(filenames), 20)
+                self.assertEqual(split_chunk(filenames[1])[0], os.path.join(self.directory, "array.json"))
+                self.assertEqual([item for content in contents for item in json.loads(content)], self.items)
+
+    def test_concatenated(self):
+        for buffer_size in (1, 7, 1024):
+            with self.subTest(buffer_size=buffer_size), patch("process.util.BUFFER_SIZE", buffer_size):
+                filenames, contents = self.read_chunks("concatenated.json", "\n".join(map(json.dumps, self.items)))
+
+                self.assertEqual(len(filenames), 20)
+                self.assertEqual(
+                    [item for content in contents for item in ijson.items(content, "", multiple_values=True)],
+                    self.items,
+                )
+
+    @override_settings(FILE_CHUNK_SIZE=1000)
+    def test_chunk_size(self):
+        filenames, contents = self.read_chunks("array.json", json.dumps(self.items))
+
+        self.assertEqual(len(filenames), 4)
+        self.assertTrue(all(len(content) >= 1000 for content in contents[:-1]))
+        self.assertEqual([item for content in contents for item in json.loads(content)], self.items)
+
+    def test_not_split(self):
+        for filename, content in (("object.json", json.dumps({"releases": self.items})), ("small.json", "[]")):
+            with self.subTest(filename=filename):
+                filenames, _ = self.read_chunks(filename, content)
+
+                self.assertEqual(filenames, [os.path.join(self.directory, filename)])
+
+        with override_settings(FILE_CHUNK_SIZE=0):
+            filenames, _ = self.read_chunks("array.json", json.dumps(self.items))
+
+        self.assertEqual(filenames, [os.path.join(self.directory, "array.json")])
+
+
+class PrefetcherTests(SimpleTestCase):
+    def test_iterate(self):
+        for size in (0, 1, 3):
+            with self.subTest(size=size):
+                self.assertEqual(list(Prefetcher(range(10), size)), list(range(10)))
+
+    def test_exception(self):
+        def iterable():
+            yield 1
+            raise ValueError("message")
+
+        for size in (0, 1, 3):
+            with self.subTest(size=size):
+                items = []
+                with self.assertRaisesRegex(ValueError, "message"):
+                    items.extend(Prefetcher(iterable(), size))
+
+                self.assertEqual(items, [1])
+
+    def test_close(self):
+        closed = []
+
+        def iterable():
+            try:
+                yield from range(10)
+            finally:
+                closed.append(True)
+
+        pipeline = iter(Prefetcher(iterable(), 1))
+        self.assertEqual(next(pipeline), 0)
+        pipeline.close()
+
+        self.assertEqual(closed, [True])
+
+    def test_timing(self):
+        pipeline = Prefetcher(range(10), 1)
+        list(pipeline)
+
+        self.assertGreater(pipeline.produce_time, 0)
+        self.assertGreaterEqual(pipeline.produce_wait, 0)
+        self.assertGreater(pipeline.consume_wait, 0)
+
+
+class CanonicalJsonTests(SimpleTestCase):
+    def assert_canonical(self, data):
+        expected = simplejson.dumps(data, separators=(",", ":"), sort_keys=True, use_decimal=True).encode()
+        self.assertEqual(canonical_json(data, floats=False), expected)
+        self.assertEqual(canonical_json(data), expected)
+
+    def test_strings(self):
+        for value in (
+            "",
+            "ascii",
+            'quote " backslash \\ slash /',
+            "\b\f\n\r\t\x00\x01\x1f",
+            "\x7f DEL",
+            "café ñandú \x80 \xa0 \u2028 \u2029 \ufeff \uffff",
+            "emoji \U0001f600 \U00010000 \U0010ffff",
+            "mixed \x7f é \U0001f600 \x1f",
+        ):
+            with self.subTest(value=value):
+                self.assert_canonical({"key": value, value: [value]})
+
+    def test_numbers(self):
+        for value in (
+            0,
+            -1,
+            2**63 - 1,
+            -(2**63),
+            2**64,
+            10**30,
+            Decimal("0.1"),
+            Decimal("-0.0"),
+            Decimal("1.10"),
+            Decimal("1E+2"),
+            Decimal("1e-7"),
+            Decimal("123456789012345678901234567890.123456789"),
+        ):
+            with self.subTest(value=value):
+                self.assert_canonical({"value": value, "values": [value, {"value": value}]})
+
+    def test_structure(self):
+        self.assert_canonical(
+            OrderedDict(
+                [
+                    ("z", None),
+                    ("é", True),
+                    ("a", False),
+                    ("\U0001f600", []),
+                    ("B", {}),
+                    ("\uffff", [[{"y": 1, "x": [{"b": "c", "a": "d"}]}]]),
+                ]
+            )
+        )
+
+    def test_lone_surrogate(self):
+        self.assert_canonical({"value": "\ud800"})
+
+    def test_floats(self):
+        for value in (0.1, 1e16, 1e-7, 1.0):
+            with self.subTest(value=value):
+                self.assertEqual(
+                    canonical_json({"value": value}),
+                    simplejson.dumps({"value": value}, separators=(",", ":"), use_decimal=True).encode(),
+                )
+
+    def test_fixtures(self):
+        for filename, prefix in (
+            ("collection_file.json", "releases.item"),
+            ("compiled_release.json", "item"),
+            ("record_package.json", "records.item"),
+            ("release_package_metadata_last.json", "releases.item"),
+        ):
+            with self.subTest(filename=filename), open(f"tests/fixtures/{filename}", "rb") as f:
+                for item in ijson.items(f, prefix, multiple_values=True):
+                    self.assert_canonical(item)
+
+    def test_get_hash(self):
+        # The digests of existing rows must not change.
+        data = {"ocid": "ocds-213czf-1", "tag": ["tender"], "value": Decimal("1.50"), "title": "Café \U0001f600"}
+
+        self.assertEqual(get_hash(data), "08aaeaa3699217f5e66a0d0c32570866")
+        self.assertEqual(get_hash(data, floats=False), get_hash(data))
+
+
 @override_settings(DEDUPLICATE_DATA=True)
 class GetOrCreateDeduplicateTests(TestCase):
     def test_reuses_row_for_identical_data(self):
@@ -57,6 +569,90 @@ class GetOrCreateDeduplicateTests(TestCase):
         self.assertTrue(first.hash_md5)
         self.assertTrue(second.hash_md5)
 
+    def test_bulk_preserves_order_and_reuses_rows(self):
+        existing = get_or_create(Data, {"ocid": "ocds-2"})
+
+        objects = bulk_get_or_create(
+            Data, [{"ocid": "ocds-3"}, {"ocid": "ocds-2"}, {"ocid": "ocds-1"}, {"ocid": "ocds-3"}]
+        )
+
+        self.assertEqual(
+            [obj.data for obj in objects],
+            [{"ocid": "ocds-3"}, {"ocid": "ocds-2"}, {"ocid": "ocds-1"}, {"ocid": "ocds-3"}],
+        )
+        self.assertEqual(objects[1].pk, existing.pk)
+        self.assertEqual(objects[0].pk, objects[3].pk)
+        self.assertEqual(Data.objects.count(), 3)
+        for obj in objects:
+            self.assertEqual(Data.objects.get(pk=obj.pk).data, obj.data)
+
+    def test_bulk_empty(self):
+        self.assertEqual(bulk_get_or_create(Data, []), [])
+
+    def test_stores_canonical_data(self):
+        data = {"ocid": "ocds-1", "title": "Café \U0001f600 \x7f", "value": Decimal("1.50")}
+
+        obj = get_or_create(Data, data, floats=False)
+
+        self.assertEqual(obj.hash_md5, get_hash(data))
+        self.assertEqual(
+            Data.objects.get(pk=obj.pk).data, {"ocid": "ocds-1", "title": "Café \U0001f600 \x7f", "value": 1.5}
+        )
+
+
+@override_settings(DATA_CACHE_SIZE=2)
+class GetOrCreateCacheTests(TestCase):
+    def setUp(self):
+        get_hash_id_cache.cache_clear()
+
+    def get_or_create_ids(self, *values):
+        return bulk_get_or_create_ids(Data, [canonical_json({"ocid": value}) for value in values])
+
+    def test_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = self.get_or_create_ids("a", "b")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_or_create_ids("b", "a"), ids[::-1])
+
+    def test_evicted(self):
+        ids = []
+        for value in ("a", "b", "c"):
+            with self.captureOnCommitCallbacks(execute=True):
+                ids.extend(self.get_or_create_ids(value))
+
+        # The hash is in the Bloom filter, so it is selected, not inserted.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_or_create_ids("a"), ids[:1])
+
+    def test_not_committed(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            ids = self.get_or_create_ids("a")
+
+        # The INSERT skips the existing row, which is then selected.
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_or_create_ids("a"), ids)
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_contains(self):
+        bloom_filter = BloomFilter(100)
+        hashes = [get_hash(i) for i in range(100)]
+        for hash_md5 in hashes:
+            bloom_filter.add(hash_md5)
+
+        for hash_md5 in hashes:
+            self.assertIn(hash_md5, bloom_filter)
+        self.assertLess(sum(get_hash(i) in bloom_filter for i in range(100, 1100)), 50)
+
+    def test_clear_at_capacity(self):
+        bloom_filter = BloomFilter(1)
+        bloom_filter.add(get_hash(1))
+        bloom_filter.add(get_hash(2))
+
+        self.assertEqual(bloom_filter.count, 1)
+        self.assertIn(get_hash(2), bloom_filter)
+
 
 @override_settings(DEDUPLICATE_DATA=False)
 class GetOrCreateNoDeduplicateTests(TestCase):
@@ -68,3 +664,26 @@ class GetOrCreateNoDeduplicateTests(TestCase):
         self.assertEqual(Data.objects.count(), 2)
         self.assertEqual(first.hash_md5, "")
         self.assertEqual(second.hash_md5, "")
+
+    def test_stores_serialized_data(self):
+        data = {"title": "Café \U0001f600 \x7f", "value": Decimal("1.50"), "ocid": "ocds-1", "big": 2**64}
+
+        ids = bulk_get_or_create_ids(Data, [serialize_json(data)])
+
+        self.assertEqual(
+            Data.objects.get(pk=ids[0]).data,
+            {"ocid": "ocds-1", "title": "Café \U0001f600 \x7f", "value": 1.5, "big": 2**64},
+        )
+
+
+class SerializeJsonTests(SimpleTestCase):
+    def test_serialize_json(self):
+        data = {"b": "Café \U0001f600", "a": Decimal("1.50")}
+
+        self.assertEqual(serialize_json(data), '{"b":"Café \U0001f600","a":1.50}'.encode())
+        self.assertEqual(json.loads(serialize_json(data)), json.loads(canonical_json(data, floats=False)))
+
+    def test_fallback(self):
+        data = {"b": 2**64, "a": 1}
+
+        self.assertEqual(serialize_json(data), canonical_json(data))